@@ -0,0 +1,107 @@
+"""Benchmarks Argon2 parameters on the current machine, to size the
+`security.argon2` settings and the CPU and RAM of each login
+
+Usage:
+    python -m app.cmd.calibrate_argon2 [--runs 5] [--target-ms 250]
+"""
+
+import argparse
+import statistics
+import time
+
+from argon2 import PasswordHasher
+
+from app.core import settings
+
+TIME_COSTS = (1, 2, 3, 4)
+# KiB, from the OWASP minimum (19 MiB) to 256 MiB
+MEMORY_COSTS = (19456, 47104, 65536, 131072, 262144)
+PASSWORD = 'Calibration123'
+
+
+def benchmark(
+    time_cost: int, memory_cost: int, parallelism: int, runs: int
+) -> tuple[float, float]:
+    """Hash a password with the parameters and measure it
+
+    Returns:
+        tuple[float, float]: The median wall time and CPU time (of all the
+        lanes threads) of a hash, in milliseconds.
+    """
+    argon2 = settings.security.argon2
+    hasher = PasswordHasher(
+        time_cost=time_cost,
+        memory_cost=memory_cost,
+        parallelism=parallelism,
+        hash_len=argon2.hash_len,
+        salt_len=argon2.salt_len,
+    )
+    hasher.hash(PASSWORD)  # Warm up
+
+    wall_times, cpu_times = [], []
+    for _ in range(runs):
+        wall_start, cpu_start = time.perf_counter(), time.process_time()
+        hasher.hash(PASSWORD)
+        wall_times.append(time.perf_counter() - wall_start)
+        cpu_times.append(time.process_time() - cpu_start)
+    return (
+        statistics.median(wall_times) * 1000,
+        statistics.median(cpu_times) * 1000,
+    )
+
+
+def calibrate(runs: int, target_ms: float, parallelism: int):
+    workers = settings.security.password_hashing_workers
+    print(
+        f'Argon2id, parallelism {parallelism}, median of {runs} runs, '
+        f'{workers} hashing workers per process\n'
+    )
+    print(
+        f'{"time_cost":>9} {"memory_cost":>11} {"latency ms":>10} '
+        f'{"cpu ms":>8} {"RAM MiB":>8} {"workers RAM MiB":>15}'
+    )
+
+    best = None
+    for memory_cost in MEMORY_COSTS:
+        for time_cost in TIME_COSTS:
+            latency, cpu = benchmark(time_cost, memory_cost, parallelism, runs)
+            ram = memory_cost / 1024
+            print(
+                f'{time_cost:>9} {memory_cost:>11} {latency:>10.1f} '
+                f'{cpu:>8.1f} {ram:>8.1f} {ram * workers:>15.1f}'
+            )
+            # The most expensive parameters within the target latency
+            if latency <= target_ms:
+                best = (time_cost, memory_cost)
+
+    current = settings.security.argon2
+    print(
+        f'\nCurrent: time_cost={current.time_cost} '
+        f'memory_cost={current.memory_cost} '
+        f'parallelism={current.parallelism}'
+    )
+    if best:
+        print(
+            f'Suggested for {target_ms:.0f} ms: time_cost={best[0]} '
+            f'memory_cost={best[1]} parallelism={parallelism}'
+        )
+    else:
+        print(f'No parameters hash within {target_ms:.0f} ms')
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--runs', type=int, default=5)
+    parser.add_argument(
+        '--target-ms',
+        type=float,
+        default=250,
+        help='Max latency of a hash to suggest parameters',
+    )
+    parser.add_argument(
+        '--parallelism',
+        type=int,
+        default=settings.security.argon2.parallelism,
+    )
+    args = parser.parse_args()
+    calibrate(args.runs, args.target_ms, args.parallelism)
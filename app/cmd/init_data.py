@@ -10,6 +10,7 @@ from app.core.db.postgres import async_session
 from app.models.category import Category
 from app.models.record import Record
 from app.models.user import User
+from app.repositories.record_rollup_repository import RecordRollupRepository
 
 
 async def init_db():
@@ -47,7 +48,7 @@ async def add_admin_records(session: AsyncSession, user: User):
     result = await session.scalars(select(Category))
     categories = result.all()
 
-    session.add_all([
+    records = [
         Record(
             description=''.join(
                 random.choice(string.ascii_letters)
@@ -59,7 +60,10 @@ async def add_admin_records(session: AsyncSession, user: User):
             user_id=user.id,
         )
         for _ in range(20)
-    ])
+    ]
+    session.add_all(records)
+    # Keep the summaries rollups in sync with the seeded records
+    await RecordRollupRepository(session).add_records(user.id, records)
     await session.commit()
 
 
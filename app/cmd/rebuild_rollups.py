@@ -0,0 +1,66 @@
+import asyncio
+
+from sqlalchemy import Date, delete, func, insert, select, text
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from app.core import log
+from app.core.db.postgres import async_session
+from app.models.record import Record
+from app.models.record_rollup import RecordRollup
+from app.models.user import User
+
+# Number of users whose rollups are rebuilt in each transaction
+BATCH_SIZE = 500
+
+
+async def rebuild_rollups():
+    async with async_session() as session:
+        last_user_id = 0
+        while True:
+            user_ids = (
+                await session.scalars(
+                    select(User.id)
+                    .where(User.id > last_user_id)
+                    .order_by(User.id)
+                    .limit(BATCH_SIZE)
+                )
+            ).all()
+            if not user_ids:
+                break
+
+            await rebuild_users_rollups(session, user_ids)
+            await session.commit()
+            log.info(f'Rebuilt the rollups of users up to id {user_ids[-1]}')
+            last_user_id = user_ids[-1]
+
+
+async def rebuild_users_rollups(session: AsyncSession, user_ids: list[int]):
+    # Record writes upsert the rollups before inserting the record, so
+    # this lock makes them wait for the batch, or the batch wait for them,
+    # and no record is missed or counted twice
+    await session.execute(text('LOCK TABLE record_rollups IN EXCLUSIVE MODE'))
+    await session.execute(
+        delete(RecordRollup).where(RecordRollup.user_id.in_(user_ids))
+    )
+
+    month = func.date_trunc('month', func.timezone('UTC', Record.date))
+    stmt = (
+        select(
+            Record.user_id,
+            Record.category_id,
+            month.cast(Date).label('month'),
+            func.sum(Record.amount),
+            func.count(),
+        )
+        .where(Record.user_id.in_(user_ids))
+        .group_by(Record.user_id, Record.category_id, 'month')
+    )
+    await session.execute(
+        insert(RecordRollup).from_select(
+            ['user_id', 'category_id', 'month', 'total', 'count'], stmt
+        )
+    )
+
+
+if __name__ == '__main__':
+    asyncio.run(rebuild_rollups())
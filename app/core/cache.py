@@ -0,0 +1,125 @@
+import threading
+import time
+import weakref
+from collections import OrderedDict
+from typing import Any
+
+# All the caches created, so they can be cleared at once
+_caches: weakref.WeakSet['TTLCache'] = weakref.WeakSet()
+# Value of the keys invalidated, which are kept to track their version
+_INVALIDATED = object()
+
+
+class TTLCache[K, V]:
+    """A thread-safe, in-process LRU cache whose entries expire after a
+    time to live, with hit and miss counters
+
+    Invalidating a key bumps its version. Loaders read the version before
+    loading a value and pass it to `set`, so a value loaded before an
+    invalidation is not stored after it.
+    """
+
+    def __init__(self, maxsize: int, ttl: float):
+        """Initialize the cache
+
+        Args:
+            maxsize (int): The max entries kept, the least recently used
+            ones are evicted first.
+            ttl (float): The seconds an entry lives.
+        """
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self.hits = 0
+        self.misses = 0
+        self._clears = 0
+        # Key -> (expires at, version, value)
+        self._entries: OrderedDict[K, tuple[float, int, Any]] = OrderedDict()
+        self._lock = threading.Lock()
+        _caches.add(self)
+
+    def get(self, key: K, default: Any = None) -> V | Any:
+        """Get the value of a key, or the default if it is missing or
+        expired"""
+        now = time.monotonic()
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None and entry[0] <= now:
+                del self._entries[key]
+                entry = None
+            if entry is None or entry[2] is _INVALIDATED:
+                self.misses += 1
+                return default
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return entry[2]
+
+    def version(self, key: K) -> tuple[int, int]:
+        """Get the version of a key, to be passed to `set` by loaders"""
+        with self._lock:
+            return self._clears, self._key_version(key)
+
+    def set(
+        self,
+        key: K,
+        value: V,
+        ttl: float | None = None,
+        version: tuple[int, int] | None = None,
+    ) -> None:
+        """Set the value of a key
+
+        Args:
+            key (K): The key.
+            value (V): The value.
+            ttl (float | None, optional): The seconds the entry lives.
+            Defaults to the cache ttl.
+            version (tuple[int, int] | None, optional): The key version
+            read before loading the value, it is not stored if the key was
+            invalidated since. Defaults to None.
+        """
+        expires_at = time.monotonic() + (self.ttl if ttl is None else ttl)
+        with self._lock:
+            key_version = self._key_version(key)
+            if version is not None and version != (self._clears, key_version):
+                return
+            self._store(key, (expires_at, key_version, value))
+
+    def invalidate(self, key: K) -> None:
+        """Remove the value of a key from the cache"""
+        expires_at = time.monotonic() + self.ttl
+        with self._lock:
+            version = self._key_version(key) + 1
+            self._store(key, (expires_at, version, _INVALIDATED))
+
+    def clear(self) -> None:
+        """Remove all the keys from the cache"""
+        with self._lock:
+            self._clears += 1
+            self._entries.clear()
+
+    def stats(self) -> dict[str, int]:
+        """Get the size and the hit and miss counters of the cache"""
+        with self._lock:
+            return {
+                'size': len(self._entries),
+                'hits': self.hits,
+                'misses': self.misses,
+            }
+
+    def _key_version(self, key: K) -> int:
+        entry = self._entries.get(key)
+        return entry[1] if entry is not None else 0
+
+    def _store(self, key: K, entry: tuple[float, int, Any]) -> None:
+        self._entries[key] = entry
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.maxsize:
+            self._entries.popitem(last=False)
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+
+def clear_caches() -> None:
+    """Clear all the in-process caches"""
+    for cache in list(_caches):
+        cache.clear()
@@ -0,0 +1,64 @@
+import bisect
+import threading
+import time
+
+from sqlalchemy.pool import AsyncAdaptedQueuePool, PoolProxiedConnection
+
+# Upper bounds, in seconds, of the checkout wait time histogram buckets
+WAIT_BUCKETS = (0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5)
+
+
+class Histogram:
+    """A thread-safe histogram of durations, with cumulative buckets like
+    the Prometheus ones"""
+
+    def __init__(self, buckets: tuple[float, ...]):
+        self.buckets = buckets
+        self._counts = [0] * (len(buckets) + 1)
+        self._sum = 0.0
+        self._lock = threading.Lock()
+
+    def observe(self, value: float) -> None:
+        index = bisect.bisect_left(self.buckets, value)
+        with self._lock:
+            self._counts[index] += 1
+            self._sum += value
+
+    def snapshot(self) -> dict:
+        """Get the cumulative count of each bucket, by upper bound, with
+        the total count and sum"""
+        with self._lock:
+            counts, total = list(self._counts), self._sum
+        cumulative, buckets = 0, {}
+        for bound, count in zip((*self.buckets, '+Inf'), counts):
+            cumulative += count
+            buckets[str(bound)] = cumulative
+        return {'buckets': buckets, 'count': cumulative, 'sum': total}
+
+
+class InstrumentedPool(AsyncAdaptedQueuePool):
+    """Async queue pool that measures how long the checkouts wait for a
+    usable connection (queueing, connecting and pre-pinging included)"""
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.wait_histogram = Histogram(WAIT_BUCKETS)
+
+    def connect(self) -> PoolProxiedConnection:
+        start = time.perf_counter()
+        try:
+            return super().connect()
+        finally:
+            self.wait_histogram.observe(time.perf_counter() - start)
+
+    def stats(self) -> dict:
+        """Get the live usage of the pool"""
+        return {
+            'size': self.size(),
+            'checked_in': self.checkedin(),
+            'checked_out': self.checkedout(),
+            # Connections open beyond the pool size
+            'overflow': max(self.overflow(), 0),
+            'max_overflow': self._max_overflow,
+            'wait_seconds': self.wait_histogram.snapshot(),
+        }
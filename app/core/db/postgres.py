@@ -1,10 +1,23 @@
+import math
+import time
+from contextlib import contextmanager
+from contextvars import ContextVar
+from typing import Any, Callable, Iterator
+
+from fastapi import Request, Response
+from sqlalchemy import event, text
 from sqlalchemy.ext.asyncio import (
+    AsyncEngine,
     AsyncSession,
     async_sessionmaker,
     create_async_engine,
 )
+from sqlalchemy.orm import Session
+from sqlalchemy.sql.dml import UpdateBase
 
 from app.core import settings
+from app.core.cache import TTLCache
+from app.core.db.pool import InstrumentedPool
 
 DATABASE_URI = 'postgresql+asyncpg://{}:{}@{}:{}/{}'.format(
     settings.DATABASE_NAME,
@@ -14,13 +27,234 @@ DATABASE_URI = 'postgresql+asyncpg://{}:{}@{}:{}/{}'.format(
     settings.DATABASE_NAME,
 )
 
-engine = create_async_engine(DATABASE_URI, future=True)
+POOL = settings.database_pool
+REPLICA = settings.database_replica
+
+# Seconds the replica is behind the primary, 0 when it replayed all the
+# WAL it received and NULL when it is not a replica
+REPLICA_LAG_QUERY = """
+SELECT CASE
+    WHEN NOT pg_is_in_recovery() THEN NULL
+    WHEN pg_last_wal_receive_lsn() = pg_last_wal_replay_lsn() THEN 0
+    ELSE EXTRACT(EPOCH FROM now() - pg_last_xact_replay_timestamp())
+END
+"""
+
+
+def create_pooled_engine(uri: str) -> AsyncEngine:
+    """Create an async engine with the pool settings"""
+    return create_async_engine(
+        uri,
+        future=True,
+        poolclass=InstrumentedPool,
+        pool_size=POOL.size,
+        max_overflow=POOL.max_overflow,
+        pool_timeout=POOL.timeout,
+        pool_recycle=POOL.recycle,
+        pool_pre_ping=POOL.pre_ping,
+        connect_args={
+            'prepared_statement_cache_size': (
+                POOL.prepared_statement_cache_size
+            ),
+            'statement_cache_size': POOL.statement_cache_size,
+            'command_timeout': POOL.command_timeout,
+        },
+    )
+
+
+engine = create_pooled_engine(DATABASE_URI)
+# Optional read replica, with the same credentials as the primary
+replica_engine = None
+if REPLICA.host:
+    replica_engine = create_pooled_engine(
+        'postgresql+asyncpg://{}:{}@{}:{}/{}'.format(
+            settings.DATABASE_NAME,
+            settings.DATABASE_PASSWORD,
+            REPLICA.host,
+            REPLICA.port,
+            settings.DATABASE_NAME,
+        )
+    )
+
+# Cookie with the time of the client's last write, so its reads stay on
+# the primary until the replica has surely caught up, whatever the worker
+# that handles them
+LAST_WRITE_COOKIE = 'last_write'
+# Time of the last write of each user in this process, for the clients
+# that do not send the cookie back
+recent_writes: TTLCache[int, float] = TTLCache(
+    maxsize=REPLICA.recent_writes_maxsize,
+    ttl=REPLICA.read_your_writes_seconds,
+)
+
+
+class RoutingSession(Session):
+    """Session that runs the reads made in a `replica_reads` block on the
+    read replica, if there is one, and everything else on the primary"""
+
+    def get_bind(self, mapper=None, clause=None, **kwargs):
+        if self._flushing or isinstance(clause, UpdateBase):
+            # Insert, update or delete, the client is marked once committed
+            self.info['wrote'] = True
+        elif self.info.get('replica_reads') and replica_engine is not None:
+            return replica_engine.sync_engine
+        return engine.sync_engine
+
+
+@event.listens_for(RoutingSession, 'after_commit')
+def _mark_last_write(session: Session):
+    if not session.info.pop('wrote', False):
+        return
+    session.info['last_write'] = last_write = time.time()
+    user_id = session.info.get('user_id')
+    if user_id is not None:
+        recent_writes.set(user_id, last_write)
+    response = session.info.get('response')
+    if response is not None:
+        response.set_cookie(
+            LAST_WRITE_COOKIE,
+            str(last_write),
+            max_age=math.ceil(REPLICA.read_your_writes_seconds),
+            httponly=True,
+        )
+
+
+@event.listens_for(RoutingSession, 'after_rollback')
+def _forget_write(session: Session):
+    session.info.pop('wrote', None)
+
+
+@event.listens_for(Session, 'after_commit')
+def _run_on_commit_callbacks(session: Session):
+    for callback, args in session.info.pop('on_commit', ()):
+        callback(*args)
+
+
+@event.listens_for(Session, 'after_rollback')
+def _drop_on_commit_callbacks(session: Session):
+    session.info.pop('on_commit', None)
+
+
+def on_commit(
+    session: AsyncSession, callback: Callable[..., Any], *args: Any
+) -> None:
+    """Run a callback once the session transaction commits, or never if
+    it rolls back
+
+    Used for the cache invalidations, as invalidating before the commit
+    lets other requests cache the data that is about to change.
+    """
+    session.info.setdefault('on_commit', []).append((callback, args))
+
+
 async_session = async_sessionmaker(
-    engine, expire_on_commit=False, class_=AsyncSession
+    engine,
+    expire_on_commit=False,
+    class_=AsyncSession,
+    sync_session_class=RoutingSession,
+)
+
+
+@contextmanager
+def replica_reads(session: AsyncSession) -> Iterator[None]:
+    """Run the reads of the block on the read replica, if there is one
+
+    Only sessions of an authenticated user (`session.info['user_id']`)
+    who did not write recently use it, so users always read their own
+    writes. Other sessions, as in the login, stay on the primary.
+
+    The last write comes from the last write cookie
+    (`session.info['last_write']`) or, for the clients without cookies,
+    from the writes of the user seen by this process.
+    """
+    user_id = session.info.get('user_id')
+    last_write = max(
+        session.info.get('last_write', 0),
+        recent_writes.get(user_id, 0) if user_id is not None else 0,
+    )
+    if (
+        replica_engine is None
+        or user_id is None
+        or session.info.get('wrote')
+        or time.time() - last_write < REPLICA.read_your_writes_seconds
+    ):
+        yield
+        return
+
+    session.info['replica_reads'] = True
+    try:
+        yield
+    finally:
+        session.info.pop('replica_reads', None)
+
+
+async def get_replica_lag() -> float | None:
+    """Get how many seconds the read replica is behind the primary, None
+    if there is no replica"""
+    if replica_engine is None:
+        return None
+    async with replica_engine.connect() as connection:
+        lag = await connection.scalar(text(REPLICA_LAG_QUERY))
+    return float(lag) if lag is not None else None
+
+
+# The session of the request being handled, set by get_db
+request_session: ContextVar[AsyncSession | None] = ContextVar(
+    'request_session', default=None
 )
 
 
-async def get_db():
-    """This function is used to get a database session in an async context"""
+async def get_db(request: Request = None, response: Response = None):
+    """This function is used to get a database session in an async context
+
+    FastAPI caches the dependencies per request, so the authentication and
+    the route share this session and its connection. The session only
+    checks out a connection on its first query, and the routes of
+    `SessionReleasingRoute` close it as soon as they return.
+
+    The session is the request unit of work: the repositories only flush
+    their changes, which are committed once when the route returns and
+    rolled back if it raises.
+
+    The request writes set the last write cookie on the response, and the
+    cookie sent back pins the client reads to the primary (see
+    `replica_reads`)."""
     async with async_session() as s:
-        yield s
+        s.info['response'] = response
+        if request is not None:
+            s.info['last_write'] = _parse_last_write(
+                request.cookies.get(LAST_WRITE_COOKIE)
+            )
+        token = request_session.set(s)
+        try:
+            yield s
+            # Routes that did not release the session commit here
+            await s.commit()
+        finally:
+            request_session.reset(token)
+
+
+def _parse_last_write(cookie: str | None) -> float:
+    try:
+        return float(cookie) if cookie else 0
+    except ValueError:
+        return 0
+
+
+async def commit_request_session():
+    """Commit the session of the request being handled, if any"""
+    session = request_session.get()
+    if session is not None:
+        await session.commit()
+
+
+async def release_request_session():
+    """Close the session of the request being handled, if any, so its
+    connection goes back to the pool right away
+
+    The session and its objects are still usable afterwards, a new
+    connection is only checked out if it runs another query.
+    """
+    session = request_session.get()
+    if session is not None:
+        await session.close()
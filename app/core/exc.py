@@ -53,3 +53,12 @@ class InternalServerErrorException(HTTPException):
 class ForbiddenException(HTTPException):
     def __init__(self, detail: str = 'Forbidden'):
         super().__init__(status_code=status.HTTP_403_FORBIDDEN, detail=detail)
+
+
+class ServiceUnavailableException(HTTPException):
+    def __init__(self, detail: str = 'Service unavailable'):
+        super().__init__(
+            status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
+            detail=detail,
+            headers={'Retry-After': '1'},
+        )
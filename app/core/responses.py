@@ -0,0 +1,159 @@
+import hashlib
+from functools import cache
+from types import NoneType, UnionType
+from typing import (
+    Any,
+    Callable,
+    Mapping,
+    Optional,
+    Union,
+    get_args,
+    get_origin,
+)
+
+import orjson
+from fastapi import Request, Response, status
+from pydantic import BaseModel
+
+Encoder = Optional[Callable[[Any], Any]]
+
+
+class LazyJSONResponse(Response):
+    """JSON response whose body is rendered when it is sent, not when it
+    is created
+
+    Starlette renders the body in `Response.__init__`, so for the routes
+    it would run inside the endpoint, before `SessionReleasingRoute`
+    releases the database session, holding its connection while encoding.
+    """
+
+    media_type = 'application/json'
+
+    def __init__(
+        self,
+        render: Callable[[], bytes],
+        status_code: int = 200,
+        headers: Mapping[str, str] | None = None,
+    ) -> None:
+        self.status_code = status_code
+        self.background = None
+        self.render_body = render
+        # There is no body yet, so no Content-Length header either
+        self.init_headers(headers)
+
+    async def __call__(self, scope, receive, send) -> None:
+        self.body = self.render_body()
+        self.headers['content-length'] = str(len(self.body))
+        await super().__call__(scope, receive, send)
+
+
+class SchemaJSONResponse(LazyJSONResponse):
+    """JSON response that encodes ORM objects (or dicts holding them) in
+    the shape of a response schema straight to bytes with orjson
+
+    FastAPI does not validate nor encode the Response objects returned by
+    the routes, so routes keep their response_model for the OpenAPI
+    schema while skipping the per-item validation, jsonable_encoder and
+    stdlib json. The data comes from the database, already typed by the
+    models, so it is encoded as is.
+    """
+
+    def __init__(
+        self,
+        content: Any,
+        schema: Any,
+        status_code: int = 200,
+        headers: Mapping[str, str] | None = None,
+    ) -> None:
+        self.encoder = compile_encoder(schema)
+        super().__init__(
+            lambda: dump_json(content, self.encoder),
+            status_code=status_code,
+            headers=headers,
+        )
+
+
+def dump_json(content: Any, encoder: Encoder) -> bytes:
+    """Encode a value to JSON bytes with an encoder from `compile_encoder`"""
+    if encoder:
+        content = encoder(content)
+    # Z for UTC, like the pydantic serialization of datetimes
+    return orjson.dumps(content, option=orjson.OPT_UTC_Z)
+
+
+def concat_json_arrays(*arrays: bytes) -> bytes:
+    """Concatenate already encoded JSON arrays into a single one"""
+    items = [array[1:-1] for array in arrays if array != b'[]']
+    return b'[' + b','.join(items) + b']'
+
+
+@cache
+def compile_encoder(schema: Any) -> Encoder:
+    """Compile (once per schema) a function that converts a value into the
+    JSON shape of the schema, or None when orjson can encode it as is
+
+    Supports pydantic models, lists and optionals of them, anything else
+    is left to orjson (str, int, datetime, enums...).
+    """
+    if isinstance(schema, type) and issubclass(schema, BaseModel):
+        return _compile_model_encoder(schema)
+
+    origin, args = get_origin(schema), get_args(schema)
+    if origin is list:
+        encode_item = compile_encoder(args[0])
+        if encode_item:
+            return lambda value: [encode_item(item) for item in value]
+    elif origin in {Union, UnionType} and NoneType in args:
+        types = [arg for arg in args if arg is not NoneType]
+        encode = compile_encoder(types[0]) if len(types) == 1 else None
+        if encode:
+            return lambda value: None if value is None else encode(value)
+    return None
+
+
+def _compile_model_encoder(schema: type[BaseModel]) -> Encoder:
+    fields = [
+        (name, compile_encoder(field.annotation))
+        for name, field in schema.model_fields.items()
+    ]
+
+    def encode_model(value: Any) -> dict:
+        if isinstance(value, dict):
+            get = value.get
+        else:
+            get = value.__getattribute__
+        return {
+            name: encode(get(name)) if encode else get(name)
+            for name, encode in fields
+        }
+
+    return encode_model
+
+
+def data_etag(request: Request, user_id: int, data_version: int | str) -> str:
+    """Weak ETag of a listing, from the version of the data it shows
+    (usually the user's data version) and the requested URL, as the same
+    version renders differently per query"""
+    key = f'{user_id}:{request.url.path}?{request.url.query}'
+    digest = hashlib.blake2b(key.encode(), digest_size=8).hexdigest()
+    return f'W/"{data_version}-{digest}"'
+
+
+def etag_headers(etag: str) -> dict[str, str]:
+    """Headers that make clients revalidate the listing on every request"""
+    return {'ETag': etag, 'Cache-Control': 'private, no-cache'}
+
+
+def not_modified(request: Request, etag: str) -> Response | None:
+    """Gets a 304 response if the If-None-Match header matches the etag
+    (weak comparison), None otherwise"""
+    if_none_match = request.headers.get('If-None-Match')
+    if not if_none_match:
+        return None
+    tags = {tag.strip().removeprefix('W/') for tag in if_none_match.split(',')}
+    if '*' in tags or etag.removeprefix('W/') in tags:
+        return Response(
+            status_code=status.HTTP_304_NOT_MODIFIED,
+            headers=etag_headers(etag),
+        )
+    return None
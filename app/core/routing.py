@@ -0,0 +1,40 @@
+import functools
+from typing import Any, Callable
+
+from fastapi.routing import APIRoute
+
+from app.core.db.postgres import (
+    commit_request_session,
+    release_request_session,
+)
+
+
+class SessionReleasingRoute(APIRoute):
+    """Route that releases the request database session as soon as its
+    endpoint returns, instead of after the response is serialized
+
+    The connection is then held only while the endpoint runs its queries,
+    not while FastAPI validates and encodes the response. The request
+    changes are committed right before, or rolled back (by closing the
+    session) if the endpoint raises.
+    """
+
+    def __init__(self, path: str, endpoint: Callable[..., Any], **kwargs):
+        if not getattr(endpoint, 'releases_session', False):
+            endpoint = _release_session_after(endpoint)
+        super().__init__(path, endpoint, **kwargs)
+
+
+def _release_session_after(endpoint: Callable[..., Any]) -> Callable:
+    # Keeps the endpoint signature (through __wrapped__) for FastAPI
+    @functools.wraps(endpoint)
+    async def wrapper(*args, **kwargs):
+        try:
+            response = await endpoint(*args, **kwargs)
+            await commit_request_session()
+            return response
+        finally:
+            await release_request_session()
+
+    wrapper.releases_session = True
+    return wrapper
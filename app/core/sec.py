@@ -1,5 +1,10 @@
+import asyncio
+import secrets
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
 from datetime import datetime, timedelta, timezone
-from typing import Annotated, Any, Optional, cast
+from typing import Annotated, Any, Callable, Optional, cast
 
 import jwt
 from argon2 import PasswordHasher
@@ -8,10 +13,14 @@ from fastapi import Depends
 from fastapi.openapi.models import OAuthFlows as OAuthFlowsModel
 from fastapi.security.oauth2 import OAuth2
 from fastapi.security.utils import get_authorization_scheme_param
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.orm import make_transient_to_detached
+from sqlalchemy.orm.attributes import set_committed_value
 from starlette.requests import Request
 
 from app.core import exc, log, settings
-from app.core.db.postgres import async_session
+from app.core.cache import TTLCache
+from app.core.db.postgres import get_db
 
 
 class CustomOAuth2PasswordBearer(OAuth2):
@@ -58,8 +67,76 @@ ALGORITHM = settings.security.algorithm
 SECRET = settings.secret_key
 ACCESS_TOKEN_EXPIRE_MINUTES = settings.security.access_token_expire_minutes
 REFRESH_TOKEN_EXPIRE_MINUTES = settings.security.refresh_token_expire_minutes
+# Token of the internal endpoints, which are disabled when it is empty
+INTERNAL_TOKEN = settings.security.internal_token
 
-PWD_CONTEXT = PasswordHasher()
+# Decoded claims of the verified tokens, each one cached until it expires
+TOKEN_CACHE: TTLCache[str, dict] = TTLCache(
+    maxsize=settings.cache.tokens_maxsize,
+    ttl=REFRESH_TOKEN_EXPIRE_MINUTES * 60,
+)
+# Column values of the authenticated users, by id
+USER_CACHE: TTLCache[int, dict] = TTLCache(
+    maxsize=settings.cache.users_maxsize, ttl=settings.cache.users_ttl
+)
+
+ARGON2_PARAMETERS = settings.security.argon2
+
+PWD_CONTEXT = PasswordHasher(
+    time_cost=ARGON2_PARAMETERS.time_cost,
+    memory_cost=ARGON2_PARAMETERS.memory_cost,
+    parallelism=ARGON2_PARAMETERS.parallelism,
+    hash_len=ARGON2_PARAMETERS.hash_len,
+    salt_len=ARGON2_PARAMETERS.salt_len,
+)
+
+
+class PasswordHash(str):
+    """A password that is already hashed, stored as is by the models"""
+
+
+class PasswordHashingPool:
+    """Runs the password hashing and verification in a bounded thread
+    pool, so it does not block the event loop (argon2 releases the GIL)
+
+    When all the workers are busy and the queue is full, new jobs are
+    rejected right away instead of piling up.
+    """
+
+    def __init__(self, workers: int, queue_size: int):
+        """Initialize the pool
+
+        Args:
+            workers (int): The threads running the jobs.
+            queue_size (int): The jobs that can wait for a free worker.
+        """
+        self.executor = ThreadPoolExecutor(
+            max_workers=workers, thread_name_prefix='password-hashing'
+        )
+        self._slots = threading.BoundedSemaphore(workers + queue_size)
+
+    async def run[R](self, func: Callable[..., R], *args: Any) -> R:
+        """Run a function in the pool and wait for its result
+
+        Raises:
+            exc.ServiceUnavailableException: if the pool queue is full
+        """
+        if not self._slots.acquire(blocking=False):
+            log.warning('Password hashing queue is full')
+            raise exc.ServiceUnavailableException(
+                'Too many requests, try again later'
+            )
+        # The slot is freed when the job ends, even if the caller is
+        # cancelled while waiting for it
+        future = self.executor.submit(func, *args)
+        future.add_done_callback(lambda _: self._slots.release())
+        return await asyncio.wrap_future(future)
+
+
+HASHING_POOL = PasswordHashingPool(
+    workers=settings.security.password_hashing_workers,
+    queue_size=settings.security.password_hashing_queue_size,
+)
 
 
 class SecurityService:
@@ -124,11 +201,19 @@ class SecurityService:
         Returns:
             dict: The decoded token
         """
-        try:
-            data = jwt.decode(jwt=token, key=SECRET, algorithms=[ALGORITHM])
-            return data
-        except (jwt.DecodeError, jwt.ExpiredSignatureError):
-            raise exc.UnauthorizedException()
+        data = TOKEN_CACHE.get(token)
+        if data is None:
+            try:
+                data = jwt.decode(
+                    jwt=token, key=SECRET, algorithms=[ALGORITHM]
+                )
+            except (jwt.DecodeError, jwt.ExpiredSignatureError):
+                raise exc.UnauthorizedException()
+            # Tokens without expiration are verified every time
+            if 'exp' in data:
+                TOKEN_CACHE.set(token, data, ttl=data['exp'] - time.time())
+        # A copy, so the cached claims cannot be changed by the callers
+        return dict(data)
 
     @staticmethod
     def _create_token(to_encode: dict) -> str:
@@ -152,6 +237,14 @@ class SecurityService:
             log.error('Error hashing password in get_password_hash')
             raise exc.InternalServerErrorException()
 
+    @staticmethod
+    async def get_password_hash_async(plain_password: str) -> PasswordHash:
+        """Same as `get_password_hash`, but runs in the hashing pool"""
+        hashed_password = await HASHING_POOL.run(
+            SecurityService.get_password_hash, plain_password
+        )
+        return PasswordHash(hashed_password)
+
     @staticmethod
     def verify_password(password: str, hash: str) -> bool:
         try:
@@ -164,9 +257,28 @@ class SecurityService:
         ):
             return False
 
+    @staticmethod
+    def password_needs_rehash(hash: str) -> bool:
+        """Check if a hash was made with other parameters than the
+        current ones, and so should be upgraded"""
+        try:
+            return PWD_CONTEXT.check_needs_rehash(hash)
+        except argon2_exceptions.InvalidHashError:
+            return True
+
+    @staticmethod
+    async def verify_password_async(password: str, hash: str) -> bool:
+        """Same as `verify_password`, but runs in the hashing pool"""
+        return await HASHING_POOL.run(
+            SecurityService.verify_password, password, hash
+        )
+
+
+async def get_current_user(token: Annotated[str, Depends(auth2_scheme)]):
+    """Dependency that gets the current user from the token or cookie
 
-def get_current_user(token: Annotated[str, Depends(auth2_scheme)]):
-    """Dependency that gets the current user from the token or cookie"""
+    Async, so FastAPI runs it on the event loop instead of the threadpool,
+    as the verified tokens are mostly served from the cache."""
 
     user = SecurityService.verify_token(token)
     if not user['type'] == 'access':
@@ -174,18 +286,60 @@ def get_current_user(token: Annotated[str, Depends(auth2_scheme)]):
     return user
 
 
-async def get_db_user(user: Annotated[dict, Depends(get_current_user)]):
-    """Dependency that gets the current user from the database"""
-    models = __import__('app.models.user', fromlist=['user'])
+# Left out of the user snapshots, as the snapshots are only invalidated in
+# the process that wrote. The data version backs the listings ETags, so it
+# is always read from the database (see `UserRepository.get_data_version`)
+UNCACHED_USER_COLUMNS = frozenset({'data_version'})
 
-    async with async_session() as session:
-        db_user = await session.get(models.User, user['sub'])
-        if not db_user:
-            raise exc.UnauthorizedException()
 
+async def get_db_user(
+    user: Annotated[dict, Depends(get_current_user)],
+    session: Annotated[AsyncSession, Depends(get_db)],
+):
+    """Dependency that gets the current user from the database, or from
+    a recent snapshot of it, in the request session"""
+    models = __import__('app.models.user', fromlist=['user'])
+    # Lets the session route the user reads to the replica, and pin the
+    # user to the primary after writing
+    session.info['user_id'] = user['sub']
+
+    snapshot = USER_CACHE.get(user['sub'])
+    if snapshot is not None:
+        db_user = _user_from_snapshot(models.User, snapshot)
+        # Attached as if it was loaded by the session, without a query
+        session.add(db_user)
+        return db_user
+
+    version = USER_CACHE.version(user['sub'])
+    db_user = await session.get(models.User, user['sub'])
+    if not db_user:
+        raise exc.UnauthorizedException()
+
+    snapshot = {
+        attr.key: getattr(db_user, attr.key)
+        for attr in models.User.__mapper__.column_attrs
+        if attr.key not in UNCACHED_USER_COLUMNS
+    }
+    USER_CACHE.set(user['sub'], snapshot, version=version)
     return db_user
 
 
+def invalidate_db_user(user_id: int) -> None:
+    """Drop the cached snapshot of a user, must be called after the user
+    row is changed (and committed)"""
+    USER_CACHE.invalidate(user_id)
+
+
+def _user_from_snapshot(model: type, snapshot: dict) -> Any:
+    """Build a detached user from its column values, as if it was loaded
+    by another session"""
+    user = model.__mapper__.class_manager.new_instance()
+    for key, value in snapshot.items():
+        set_committed_value(user, key, value)
+    make_transient_to_detached(user)
+    return user
+
+
 def get_refresh_token(request: Request) -> str:
     """Get the refresh token from the request headers"""
     authorization = request.headers.get('X-Refresh-Token')
@@ -193,3 +347,13 @@ def get_refresh_token(request: Request) -> str:
     if not authorization or scheme.lower() != 'bearer':
         raise exc.UnauthorizedException('No refresh token provided')
     return token
+
+
+def verify_internal_token(request: Request) -> None:
+    """Dependency that only lets through the requests with the internal
+    token in the X-Internal-Token header"""
+    if not INTERNAL_TOKEN:
+        raise exc.NotFoundException()
+    token = request.headers.get('X-Internal-Token', '')
+    if not secrets.compare_digest(token.encode(), INTERNAL_TOKEN.encode()):
+        raise exc.UnauthorizedException('Invalid internal token')
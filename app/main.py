@@ -2,6 +2,7 @@ from fastapi import FastAPI
 from fastapi.middleware.cors import CORSMiddleware
 
 from app.core.exc import configure_exception_handlers
+from app.routers import internal_router
 from app.routers.v1 import main_router
 
 APP_NAME = 'Savvy API'
@@ -27,3 +28,4 @@ app.add_middleware(
 
 # Include the main router to the main app
 app.include_router(main_router)
+app.include_router(internal_router.router)
@@ -5,9 +5,10 @@ from app.utils.functions import update_model_timestamp
 from .base import Base
 from .category import Category
 from .record import Record
+from .record_rollup import RecordRollup
 from .user import User
 
 # Event listeners for models
 event.listen(User, 'before_update', update_model_timestamp)
 
-__all__ = ['Base', 'User', 'Record', 'Category']
+__all__ = ['Base', 'User', 'Record', 'RecordRollup', 'Category']
@@ -1,6 +1,6 @@
 from datetime import datetime
 
-from sqlalchemy import DateTime, ForeignKey, Integer
+from sqlalchemy import DateTime, ForeignKey, Index, Integer
 from sqlalchemy.orm import Mapped, mapped_column, relationship
 
 from .base import Base
@@ -8,6 +8,27 @@ from .base import Base
 
 class Record(Base):
     __tablename__ = 'records'
+    __table_args__ = (
+        # Keyset pagination index, scanned backwards for newest first
+        Index('ix_records_user_id_date_id', 'user_id', 'date', 'id'),
+        # Sorting and filtering of the user records
+        Index(
+            'ix_records_user_id_category_id_date_id',
+            'user_id',
+            'category_id',
+            'date',
+            'id',
+        ),
+        Index('ix_records_user_id_amount_id', 'user_id', 'amount', 'id'),
+        # Trigram search of the user records descriptions
+        Index(
+            'ix_records_user_id_description_trgm',
+            'user_id',
+            'description',
+            postgresql_using='gin',
+            postgresql_ops={'description': 'gin_trgm_ops'},
+        ),
+    )
 
     id: Mapped[int] = mapped_column(Integer, primary_key=True)
     amount: Mapped[int] = mapped_column(nullable=False, index=True)
@@ -0,0 +1,23 @@
+from datetime import date
+
+from sqlalchemy import BigInteger, Date, ForeignKey, Integer
+from sqlalchemy.orm import Mapped, mapped_column
+
+from .base import Base
+
+
+class RecordRollup(Base):
+    """Monthly (UTC) totals of the user records by category, kept up to
+    date by the record writes"""
+
+    __tablename__ = 'record_rollups'
+
+    user_id: Mapped[int] = mapped_column(
+        ForeignKey('users.id', ondelete='CASCADE'), primary_key=True
+    )
+    category_id: Mapped[int] = mapped_column(
+        ForeignKey('categories.id', ondelete='CASCADE'), primary_key=True
+    )
+    month: Mapped[date] = mapped_column(Date, primary_key=True)
+    total: Mapped[int] = mapped_column(BigInteger, nullable=False)
+    count: Mapped[int] = mapped_column(Integer, nullable=False)
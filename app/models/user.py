@@ -1,9 +1,9 @@
 from datetime import datetime, timezone
 
-from sqlalchemy import DateTime, Integer, String
+from sqlalchemy import BigInteger, DateTime, Integer, String
 from sqlalchemy.orm import Mapped, mapped_column, validates
 
-from app.core.sec import SecurityService
+from app.core.sec import PasswordHash, SecurityService
 
 from .base import Base
 
@@ -25,10 +25,17 @@ class User(Base):
         default=datetime.now(timezone.utc),
     )
     categories_count: Mapped[int] = mapped_column(Integer, default=0)
+    # Bumped on every write to the user's records or categories
+    data_version: Mapped[int] = mapped_column(
+        BigInteger, default=0, server_default='0'
+    )
 
     @validates('password')
     def _validate(_, key, password):
-        """Ensures that the password will be hashed"""
+        """Ensures that the password will be hashed, passwords hashed
+        beforehand (off the event loop) are stored as is"""
+        if isinstance(password, PasswordHash):
+            return password
         return SecurityService.get_password_hash(password)
 
     def verify_password(self, plain_password):
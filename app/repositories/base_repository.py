@@ -2,14 +2,20 @@ from typing import Optional, Sequence, Union
 from uuid import UUID
 
 from pydantic import BaseModel
-from sqlalchemy import select
+from sqlalchemy import delete, func, insert, select, update
 from sqlalchemy.ext.asyncio import AsyncSession
 
 from app.core import log
+from app.core.db.postgres import replica_reads
 
 
 class AsyncCRUDRepository[T]:
-    """An async BASE repository for CRUD operations"""
+    """An async BASE repository for CRUD operations
+
+    The repositories do not commit, their changes are flushed to the
+    session transaction, which is committed once by its owner (for the
+    requests, `get_db`).
+    """
 
     def __init__(self, session: AsyncSession, model: T):
         """Initialize the repository
@@ -31,10 +37,58 @@ class AsyncCRUDRepository[T]:
             T: The saved instance.
         """
         self.session.add(instance)
-        await self.session.commit()
+        await self.session.flush()
         await self.session.refresh(instance)
         return instance
 
+    async def create(self, values: dict) -> T:
+        """Insert a row with a single INSERT ... RETURNING statement,
+        instead of adding, flushing and refreshing an instance
+
+        The model validators are not run, so the values must be final
+        (e.g. already hashed passwords).
+
+        Args:
+            values (dict): The column values of the row.
+
+        Returns:
+            T: The created instance.
+        """
+        stmt = insert(self.model).returning(self.model)
+        instance = await self.session.scalar(stmt, [values])
+        return instance
+
+    async def bulk_insert(
+        self, values: Sequence[dict], chunk_size: int = 1000
+    ) -> None:
+        """Insert many rows with chunked multi-row INSERT statements, all
+        in the session transaction
+
+        Args:
+            values (Sequence[dict]): The column values of each row.
+            chunk_size (int, optional): The max rows per INSERT statement.
+            Defaults to 1000.
+        """
+        for start in range(0, len(values), chunk_size):
+            chunk = values[start : start + chunk_size]
+            await self.session.execute(insert(self.model).values(chunk))
+
+    async def save_many(self, values: Sequence[dict]) -> Sequence[T]:
+        """Insert many rows with a single INSERT ... RETURNING statement
+
+        Args:
+            values (Sequence[dict]): The column values of each row.
+
+        Returns:
+            Sequence[T]: The saved instances, in the same order as values.
+        """
+        stmt = insert(self.model).returning(
+            self.model, sort_by_parameter_order=True
+        )
+        scalar_result = await self.session.scalars(stmt, values)
+        instances = scalar_result.all()
+        return instances
+
     async def get_all(self, stmt=None) -> Sequence[T]:
         """Get all instances of the model
 
@@ -48,7 +102,8 @@ class AsyncCRUDRepository[T]:
         if stmt is None:
             stmt = select(self.model)
 
-        scalar_result = await self.session.scalars(stmt)
+        with replica_reads(self.session):
+            scalar_result = await self.session.scalars(stmt)
         instances = scalar_result.all()
         return instances
 
@@ -62,44 +117,69 @@ class AsyncCRUDRepository[T]:
             Optional[T]: The instance or None if not found.
         """
         stmt = select(self.model).where(self.model.id == pk)
-        instance = await self.session.scalar(stmt)
+        with replica_reads(self.session):
+            instance = await self.session.scalar(stmt)
         return instance
 
-    async def delete_by_id(self, pk: UUID | int) -> Optional[T]:
-        """Delete an instance by its id
+    async def delete_by_id(self, pk: UUID | int, *criteria) -> Optional[T]:
+        """Delete an instance by its id with a single DELETE ... RETURNING
+        statement
 
         Args:
             pk (UUID | int): The id of the instance.
+            *criteria: Extra conditions the row must meet to be deleted,
+            such as its owner.
 
         Returns:
-            Optional[T]: The deleted instance or None if not found.
+            Optional[T]: The deleted instance or None if no row matched.
         """
-        instance = await self.get_by_id(pk)
-        if not instance:
-            return None
-
-        await self.session.delete(instance)
-        await self.session.commit()
+        stmt = (
+            delete(self.model)
+            .where(self.model.id == pk, *criteria)
+            .returning(self.model)
+        )
+        instance = await self.session.scalar(stmt)
         return instance
 
     async def update_by_id(
-        self, pk: UUID | int, data: Union[dict, BaseModel]
+        self, pk: UUID | int, data: Union[dict, BaseModel], *criteria
     ) -> Union[None, T]:
-        """Update an instance by its id
+        """Update an instance by its id with a single UPDATE ... RETURNING
+        statement
+
+        The model validators are not run, so the values must be final
+        (e.g. already hashed passwords).
 
         Args:
             pk (UUID | int): The id of the instance.
             data (Union[dict, BaseModel]): The data to be updated. Needs to
-            be a dictionary or a Pydantic model.
+            be a dictionary or a Pydantic model, None values are skipped.
+            *criteria: Extra conditions the row must meet to be updated,
+            such as its owner.
 
         Returns:
-            Union[None, T]: The updated instance or None if not found.
+            Union[None, T]: The updated instance or None if no row matched.
         """
-        instance = await self.get_by_id(pk)
-        if not instance:
-            return None
-
-        return await self.update(instance, data)
+        values = AsyncCRUDRepository.update_values(self.model, data)
+        if not values:
+            # Nothing to update, the row is read as is
+            instance = await self.session.scalar(
+                select(self.model).where(self.model.id == pk, *criteria)
+            )
+            return instance
+
+        if hasattr(self.model, 'updated_at'):
+            # The ORM before_update events do not run for UPDATE statements
+            values.setdefault('updated_at', func.now())
+
+        stmt = (
+            update(self.model)
+            .where(self.model.id == pk, *criteria)
+            .values(values)
+            .returning(self.model)
+        )
+        instance = await self.session.scalar(stmt)
+        return instance
 
     async def update(self, instance: T, data: Union[dict, BaseModel]) -> T:
         """Update an instance
@@ -114,10 +194,37 @@ class AsyncCRUDRepository[T]:
         """
         AsyncCRUDRepository.update_instance_fields(instance, data)
         self.session.add(instance)
-        await self.session.commit()
+        await self.session.flush()
         await self.session.refresh(instance)
         return instance
 
+    @staticmethod
+    def update_values(model: T, data: Union[dict, BaseModel]) -> dict:
+        """Get the values of an update, in the same way as
+        `update_instance_fields` (unknown fields and None values are
+        skipped)
+
+        Args:
+            model (T): The model class or instance being updated.
+            data (Union[dict, BaseModel]): The data to be updated. Needs to
+            be a dictionary or a Pydantic model.
+
+        Returns:
+            dict: The column values to be updated.
+        """
+        if isinstance(data, BaseModel):
+            data = dict(data)
+        elif not isinstance(data, dict):
+            log.exception(f'Invalid data type updating model: {type(data)}')
+            raise TypeError(
+                f'Invalid data type: {type(data)}. Expected dict or BaseModel.'
+            )
+        return {
+            field: value
+            for field, value in data.items()
+            if hasattr(model, field) and value is not None
+        }
+
     @staticmethod
     def update_instance_fields(model: T, data: Union[dict, BaseModel]):
         """Update the fields of an instance
@@ -169,21 +276,23 @@ class AsyncCRUDRepositoryWithEmail[T](AsyncCRUDRepository[T]):
         if stmt is None:
             stmt = select(self.model).where(self.model.email == email)
 
-        instance = await self.session.scalar(stmt)
+        with replica_reads(self.session):
+            instance = await self.session.scalar(stmt)
         return instance
 
     async def delete_by_email(self, email: str) -> Optional[T]:
-        """Delete an instance by its email
+        """Delete an instance by its email with a single DELETE ...
+        RETURNING statement
 
         Args:
             email (str): The email of the instance.
         Returns:
             Optional[T]: The deleted instance or None if not found.
         """
-        instance = await self.get_by_email(email)
-        if not instance:
-            return None
-
-        await self.session.delete(instance)
-        await self.session.commit()
+        stmt = (
+            delete(self.model)
+            .where(self.model.email == email)
+            .returning(self.model)
+        )
+        instance = await self.session.scalar(stmt)
         return instance
@@ -1,3 +1,7 @@
+from typing import Sequence
+
+from sqlalchemy import ARRAY, Integer, any_, literal, or_, select
+
 from app.models.category import Category
 
 from .base_repository import AsyncCRUDRepository
@@ -7,6 +11,40 @@ class CategoryRepository(AsyncCRUDRepository[Category]):
     def __init__(self, session):
         super().__init__(session, Category)
 
-    async def delete_instance(self, instance: Category) -> None:
-        await self.session.delete(instance)
-        await self.session.commit()
+    async def get_public(self) -> Sequence[Category]:
+        """Get the categories that do not belong to any user"""
+        stmt = (
+            select(Category)
+            .where(Category.user_id.is_(None))
+            .order_by(Category.id)
+        )
+        return await self.get_all(stmt)
+
+    async def get_by_user_id(self, user_id: int) -> Sequence[Category]:
+        """Get the categories owned by a user"""
+        stmt = (
+            select(Category)
+            .where(Category.user_id == user_id)
+            .order_by(Category.id)
+        )
+        return await self.get_all(stmt)
+
+    async def get_allowed_by_ids(
+        self, ids: Sequence[int], user_id: int
+    ) -> Sequence[Category]:
+        """Get the categories with the given ids that the user can use,
+        which are the public ones and the ones owned by the user
+
+        Args:
+            ids (Sequence[int]): The ids of the categories.
+            user_id (int): The id of the user.
+
+        Returns:
+            Sequence[Category]: The allowed categories found.
+        """
+        stmt = select(Category).where(
+            # Bound as a single array parameter, whatever the ids count
+            Category.id == any_(literal(list(ids), ARRAY(Integer))),
+            or_(Category.user_id.is_(None), Category.user_id == user_id),
+        )
+        return await self.get_all(stmt)
@@ -0,0 +1,68 @@
+from collections import defaultdict
+from datetime import datetime
+from typing import Iterable, Protocol
+
+from sqlalchemy.dialects.postgresql import insert
+
+from app.models.record_rollup import RecordRollup
+from app.utils.functions import month_start
+
+from .base_repository import AsyncCRUDRepository, AsyncSession
+
+
+class RecordLike(Protocol):
+    """Anything with the record fields, like a Record or a RecordIn"""
+
+    amount: int
+    category_id: int
+    date: datetime
+
+
+class RecordRollupRepository(AsyncCRUDRepository[RecordRollup]):
+    """Record rollups repository"""
+
+    def __init__(self, session: AsyncSession):
+        super().__init__(session, RecordRollup)
+
+    async def add_records(
+        self, user_id: int, records: Iterable[RecordLike], sign: int = 1
+    ) -> None:
+        """Add (or subtract, with sign -1) the records to the user rollups
+        with a single upsert. It does not commit, so the rollups change in
+        the same transaction as the records
+
+        Args:
+            user_id (int): The id of the records owner.
+            records (Iterable[RecordLike]): The records being created or
+            deleted.
+            sign (int, optional): 1 when creating records and -1 when
+            deleting them. Defaults to 1.
+        """
+        # A row can only be upserted once per statement, so the deltas
+        # are summed by rollup first
+        deltas = defaultdict(lambda: [0, 0])
+        for record in records:
+            delta = deltas[(record.category_id, month_start(record.date))]
+            delta[0] += sign * record.amount
+            delta[1] += sign
+        if not deltas:
+            return
+
+        stmt = insert(RecordRollup).values([
+            {
+                'user_id': user_id,
+                'category_id': category_id,
+                'month': month,
+                'total': total,
+                'count': count,
+            }
+            for (category_id, month), (total, count) in deltas.items()
+        ])
+        stmt = stmt.on_conflict_do_update(
+            index_elements=['user_id', 'category_id', 'month'],
+            set_={
+                'total': RecordRollup.total + stmt.excluded.total,
+                'count': RecordRollup.count + stmt.excluded.count,
+            },
+        )
+        await self.session.execute(stmt)
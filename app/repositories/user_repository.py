@@ -1,3 +1,7 @@
+from sqlalchemy import select, update
+from sqlalchemy.dialects.postgresql import insert
+
+from app.core.db.postgres import replica_reads
 from app.models.user import User
 
 from .base_repository import AsyncCRUDRepositoryWithEmail, AsyncSession
@@ -8,3 +12,135 @@ class UserRepository(AsyncCRUDRepositoryWithEmail[User]):
 
     def __init__(self, session: AsyncSession):
         super().__init__(session, User)
+
+    async def create_unless_email_exists(self, values: dict) -> User | None:
+        """Insert a user with a single INSERT ... ON CONFLICT (email) DO
+        NOTHING RETURNING statement, so concurrent signups with the same
+        email cannot both succeed nor fail with a unique violation
+
+        Args:
+            values (dict): The column values of the user, with the
+            password already hashed.
+
+        Returns:
+            User | None: The created user, or None if the email is in use.
+        """
+        stmt = (
+            insert(User)
+            .values(values)
+            .on_conflict_do_nothing(index_elements=[User.email])
+            .returning(User)
+        )
+        return await self.session.scalar(stmt)
+
+    async def get_data_version(self, user_id: int) -> int | None:
+        """Get the user's data version with a primary key lookup
+
+        Like the listings, it is read from the replica when possible. The
+        session then reads both through the same replica connection, and
+        a lagging replica cannot pair old rows with a new version (and
+        ETag).
+
+        Args:
+            user_id (int): The id of the user.
+
+        Returns:
+            int | None: The data version, or None if the user is missing.
+        """
+        stmt = select(User.data_version).where(User.id == user_id)
+        with replica_reads(self.session):
+            return await self.session.scalar(stmt)
+
+    async def bump_data_version(self, user_id: int) -> int:
+        """Increment the user's data version in the current transaction,
+        without committing it, and return the new version
+
+        Args:
+            user_id (int): The id of the user.
+
+        Returns:
+            int: The new data version.
+        """
+        stmt = (
+            update(User)
+            .where(User.id == user_id)
+            .values(data_version=User.data_version + 1)
+            .returning(User.data_version)
+            .execution_options(synchronize_session=False)
+        )
+        return await self.session.scalar(stmt)
+
+    async def increment_categories_count(
+        self, user_id: int, max_count: int
+    ) -> int | None:
+        """Increment the user's categories count, unless it reached the
+        max, and bump its data version with a single conditional UPDATE
+
+        The check and the increment happen in the database, so concurrent
+        requests of the same user cannot go over the max, and they only
+        wait for each other for as long as the row is updated.
+
+        Args:
+            user_id (int): The id of the user.
+            max_count (int): The max categories count.
+
+        Returns:
+            int | None: The new categories count, or None if the user
+            reached the max.
+        """
+        stmt = (
+            update(User)
+            .where(User.id == user_id, User.categories_count < max_count)
+            .values(
+                categories_count=User.categories_count + 1,
+                data_version=User.data_version + 1,
+            )
+            .returning(User.categories_count)
+            .execution_options(synchronize_session=False)
+        )
+        return await self.session.scalar(stmt)
+
+    async def decrement_categories_count(self, user_id: int) -> int:
+        """Decrement the user's categories count and bump its data version
+        with a single UPDATE
+
+        Args:
+            user_id (int): The id of the user.
+
+        Returns:
+            int: The new categories count.
+        """
+        stmt = (
+            update(User)
+            .where(User.id == user_id)
+            .values(
+                categories_count=User.categories_count - 1,
+                data_version=User.data_version + 1,
+            )
+            .returning(User.categories_count)
+            .execution_options(synchronize_session=False)
+        )
+        return await self.session.scalar(stmt)
+
+    async def replace_password_hash(
+        self, user_id: int, old_hash: str, new_hash: str
+    ) -> bool:
+        """Replace the password hash of a user, unless the hash was
+        changed since it was read
+
+        Args:
+            user_id (int): The id of the user.
+            old_hash (str): The hash that is expected to be stored.
+            new_hash (str): The new hash.
+
+        Returns:
+            bool: True if the hash was replaced, False otherwise.
+        """
+        stmt = (
+            update(User)
+            .where(User.id == user_id, User.password == old_hash)
+            .values(password=new_hash)
+            .execution_options(synchronize_session=False)
+        )
+        result = await self.session.execute(stmt)
+        return result.rowcount == 1
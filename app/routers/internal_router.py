@@ -0,0 +1,45 @@
+from fastapi import APIRouter, Depends
+
+from app.core.db.postgres import engine, get_replica_lag, replica_engine
+from app.core.sec import TOKEN_CACHE, USER_CACHE, verify_internal_token
+from app.services.category_service import (
+    allowed_categories_cache,
+    public_categories_cache,
+)
+
+# Operational endpoints, left out of the API docs and only reachable with
+# the internal token
+router = APIRouter(
+    prefix='/internal',
+    include_in_schema=False,
+    dependencies=[Depends(verify_internal_token)],
+)
+
+
+@router.get('/metrics/pool')
+async def get_pool_metrics():
+    """Live usage of this process database connection pool"""
+    return engine.pool.stats()
+
+
+@router.get('/metrics/replica')
+async def get_replica_metrics():
+    """Lag and pool usage of the read replica, if there is one"""
+    if replica_engine is None:
+        return {'enabled': False}
+    return {
+        'enabled': True,
+        'lag_seconds': await get_replica_lag(),
+        'pool': replica_engine.pool.stats(),
+    }
+
+
+@router.get('/metrics/caches')
+async def get_cache_metrics():
+    """Size and hit and miss counters of this process caches"""
+    return {
+        'tokens': TOKEN_CACHE.stats(),
+        'users': USER_CACHE.stats(),
+        'public_categories': public_categories_cache.stats(),
+        'allowed_categories': allowed_categories_cache.stats(),
+    }
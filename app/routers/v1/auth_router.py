@@ -1,30 +1,46 @@
-from fastapi import APIRouter
+from fastapi import APIRouter, BackgroundTasks
 
 from app.core import exc
+from app.core.db.postgres import async_session
 from app.core.dependencies import (
     AsyncDBSessionDepends,
     LoginFormDataDepends,
     RefreshTokenDepends,
 )
+from app.core.routing import SessionReleasingRoute
 from app.core.sec import SecurityService
 from app.repositories.user_repository import UserRepository
+from app.services.user_service import UserService
 
-router = APIRouter(prefix='/auth')
+router = APIRouter(prefix='/auth', route_class=SessionReleasingRoute)
 
 
 @router.post('/token')
 async def login_user(
-    form_data: LoginFormDataDepends, session: AsyncDBSessionDepends
+    form_data: LoginFormDataDepends,
+    session: AsyncDBSessionDepends,
+    background_tasks: BackgroundTasks,
 ):
     user_repository = UserRepository(session)
     email = form_data.username
     password = form_data.password
 
     user = await user_repository.get_by_email(email)
+    # Give the connection back to the pool before hashing the password,
+    # which takes a while and needs nothing else from the database
+    await session.close()
 
     # Check if user exists, if exists, check if password is correct
     # if password is correct, create an access token and return it
-    if user and SecurityService.verify_password(password, user.password):
+    if user and await SecurityService.verify_password_async(
+        password, user.password
+    ):
+        # Upgrade hashes made with old parameters after the response
+        if SecurityService.password_needs_rehash(user.password):
+            background_tasks.add_task(
+                rehash_password, user.id, user.password, password
+            )
+
         to_encode_data = {'sub': user.id}
         access_token = SecurityService.create_access_token(to_encode_data)
         refresh_token = SecurityService.create_refresh_token(to_encode_data)
@@ -38,6 +54,13 @@ async def login_user(
     raise exc.UnauthorizedException('Invalid credentials')
 
 
+async def rehash_password(user_id: int, old_hash: str, password: str):
+    """Background task that upgrades a password hash, in its own session
+    as the request one is closed by then"""
+    async with async_session() as session, session.begin():
+        await UserService(session).rehash_password(user_id, old_hash, password)
+
+
 @router.post('/token/refresh')
 async def refresh_token(
     refresh_token: RefreshTokenDepends,
@@ -1,23 +1,47 @@
-from fastapi import APIRouter, status
+from functools import partial
+
+from fastapi import APIRouter, Request, status
 
 from app.core.dependencies import (
     AsyncDBSessionDepends,
     AuthenticatedDBUserDepends,
 )
+from app.core.responses import (
+    LazyJSONResponse,
+    data_etag,
+    etag_headers,
+    not_modified,
+)
+from app.core.routing import SessionReleasingRoute
+from app.repositories.user_repository import UserRepository
 from app.schemas.category_schemas import CategoryIn
 from app.schemas.record_schemas import CategoryOut
 from app.services.category_service import CategoryService
 
-router = APIRouter()
+router = APIRouter(route_class=SessionReleasingRoute)
 
 
 @router.get('/categories', response_model=list[CategoryOut])
 async def get_gategories(
+    request: Request,
     session: AsyncDBSessionDepends,
     user: AuthenticatedDBUserDepends,
 ):
     category_service = CategoryService(session, user)
-    return await category_service.get_categories()
+    # The listing changes with the user data and with the public
+    # categories, which come already encoded from the cache
+    public = await category_service.get_public_categories()
+    data_version = await UserRepository(session).get_data_version(user.id)
+    etag = data_etag(request, user.id, f'{data_version}.{public.digest}')
+    if response := not_modified(request, etag):
+        return response
+
+    # The user categories are encoded once the session is released
+    categories = await category_service.get_own_categories()
+    return LazyJSONResponse(
+        partial(CategoryService.encode_categories, public, categories),
+        headers=etag_headers(etag),
+    )
 
 
 @router.post(
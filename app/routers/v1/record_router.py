@@ -1,27 +1,164 @@
-from fastapi import APIRouter, status
+from datetime import datetime
+from typing import Annotated
+
+from fastapi import APIRouter, Body, Query, Request, status
+from fastapi.responses import StreamingResponse
 
 from app.core.dependencies import (
     AsyncDBSessionDepends,
     AuthenticatedDBUserDepends,
 )
+from app.core.responses import (
+    SchemaJSONResponse,
+    data_etag,
+    etag_headers,
+    not_modified,
+)
+from app.core.routing import SessionReleasingRoute
+from app.repositories.user_repository import UserRepository
 from app.schemas.record_schemas import (
+    BalancePeriod,
+    ExportFormat,
+    RecordBalancePageOut,
+    RecordFilters,
+    RecordImportOut,
     RecordIn,
     RecordOut,
+    RecordPageOut,
+    RecordSummaryOut,
     RecordWithCategoryOut,
+    SummaryGroupBy,
 )
 from app.services.record_service import RecordService
 
-router = APIRouter()
+router = APIRouter(route_class=SessionReleasingRoute)
+
+DEFAULT_PAGE_SIZE = 50
+MAX_BATCH_SIZE = 100
+EXPORT_MEDIA_TYPES = {
+    ExportFormat.CSV: 'text/csv',
+    ExportFormat.NDJSON: 'application/x-ndjson',
+}
+
+
+@router.get(
+    '/records',
+    response_model=list[RecordWithCategoryOut] | RecordPageOut,
+)
+async def get_user_records(  # noqa
+    request: Request,
+    user: AuthenticatedDBUserDepends,
+    session: AsyncDBSessionDepends,
+    sort: Annotated[
+        str | None,
+        Query(description='Comma separated fields, "-" for descending'),
+    ] = None,
+    limit: Annotated[int | None, Query(ge=1, le=100)] = None,
+    cursor: str | None = None,
+    category_id: int | None = None,
+    min_amount: int | None = None,
+    max_amount: int | None = None,
+    date_from: Annotated[datetime | None, Query(alias='from')] = None,
+    date_to: Annotated[datetime | None, Query(alias='to')] = None,
+):
+    # Answer polling clients without querying the records when nothing
+    # changed since the version they have
+    data_version = await UserRepository(session).get_data_version(user.id)
+    etag = data_etag(request, user.id, data_version)
+    if response := not_modified(request, etag):
+        return response
+
+    filters = RecordFilters(
+        category_id=category_id,
+        min_amount=min_amount,
+        max_amount=max_amount,
+        date_from=date_from,
+        date_to=date_to,
+    )
+    record_service = RecordService(session, user)
+    # Paginated mode, returns a page with the cursor to the next one
+    if limit or cursor:
+        page = await record_service.get_user_records_page(
+            limit=limit or DEFAULT_PAGE_SIZE,
+            cursor=cursor,
+            sort=sort,
+            filters=filters,
+        )
+        return SchemaJSONResponse(
+            page, RecordPageOut, headers=etag_headers(etag)
+        )
+    records = await record_service.get_user_records(sort=sort, filters=filters)
+    return SchemaJSONResponse(
+        records, list[RecordWithCategoryOut], headers=etag_headers(etag)
+    )
+
+
+@router.get('/records/summary', response_model=list[RecordSummaryOut])
+async def get_records_summary(  # noqa
+    user: AuthenticatedDBUserDepends,
+    session: AsyncDBSessionDepends,
+    group_by: SummaryGroupBy,
+    date_from: Annotated[datetime | None, Query(alias='from')] = None,
+    date_to: Annotated[datetime | None, Query(alias='to')] = None,
+    tz: str = 'UTC',
+):
+    record_service = RecordService(session, user)
+    return await record_service.get_records_summary(
+        group_by, date_from=date_from, date_to=date_to, tz=tz
+    )
+
+
+@router.get('/records/balance', response_model=RecordBalancePageOut)
+async def get_records_balance(  # noqa
+    user: AuthenticatedDBUserDepends,
+    session: AsyncDBSessionDepends,
+    period: BalancePeriod,
+    date_from: Annotated[datetime | None, Query(alias='from')] = None,
+    date_to: Annotated[datetime | None, Query(alias='to')] = None,
+    tz: str = 'UTC',
+    limit: Annotated[int, Query(ge=1, le=1000)] = 366,
+    cursor: str | None = None,
+):
+    record_service = RecordService(session, user)
+    return await record_service.get_records_balance(
+        period,
+        date_from=date_from,
+        date_to=date_to,
+        tz=tz,
+        limit=limit,
+        cursor=cursor,
+    )
 
 
-@router.get('/records', response_model=list[RecordWithCategoryOut])
-async def get_user_records(
+@router.get('/records/search', response_model=list[RecordWithCategoryOut])
+async def search_user_records(
     user: AuthenticatedDBUserDepends,
     session: AsyncDBSessionDepends,
-    sort: str | None = None,
+    q: Annotated[str, Query(min_length=1, max_length=30)],
+    limit: Annotated[int, Query(ge=1, le=100)] = 20,
 ):
     record_service = RecordService(session, user)
-    return await record_service.get_user_records(sort=sort)
+    return await record_service.search_user_records(q, limit=limit)
+
+
+@router.get('/records/export', response_class=StreamingResponse)
+async def export_user_records(
+    user: AuthenticatedDBUserDepends,
+    session: AsyncDBSessionDepends,
+    export_format: Annotated[ExportFormat, Query(alias='format')] = (
+        ExportFormat.CSV
+    ),
+):
+    record_service = RecordService(session, user)
+    return StreamingResponse(
+        record_service.export_user_records(export_format),
+        media_type=EXPORT_MEDIA_TYPES[export_format],
+        headers={
+            'Content-Disposition': (
+                f'attachment; filename="records.{export_format}"'
+            )
+        },
+    )
 
 
 @router.post(
@@ -38,6 +175,49 @@ async def create_record(
     return await record_service.create_record(data)
 
 
+@router.post(
+    '/records/batch',
+    response_model=list[RecordWithCategoryOut],
+    status_code=status.HTTP_201_CREATED,
+)
+async def create_records(
+    user: AuthenticatedDBUserDepends,
+    session: AsyncDBSessionDepends,
+    data: Annotated[
+        list[RecordIn], Body(min_length=1, max_length=MAX_BATCH_SIZE)
+    ],
+):
+    record_service = RecordService(session, user)
+    return await record_service.create_records(data)
+
+
+@router.post(
+    '/records/import',
+    response_model=RecordImportOut,
+    openapi_extra={
+        'requestBody': {
+            'required': True,
+            'content': {
+                'application/json': {
+                    'schema': {'type': 'array', 'items': {'type': 'object'}}
+                },
+                'text/csv': {'schema': {'type': 'string'}},
+            },
+        }
+    },
+)
+async def import_records(
+    user: AuthenticatedDBUserDepends,
+    session: AsyncDBSessionDepends,
+    request: Request,
+):
+    rows = RecordService.parse_import_body(
+        await request.body(), request.headers.get('Content-Type', '')
+    )
+    record_service = RecordService(session, user)
+    return await record_service.import_records(rows)
+
+
 @router.delete('/records/{record_id}', response_model=RecordOut)
 async def delete_record(
     user: AuthenticatedDBUserDepends,
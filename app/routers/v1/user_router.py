@@ -4,10 +4,11 @@ from app.core.dependencies import (
     AsyncDBSessionDepends,
     AuthenticatedDBUserDepends,
 )
+from app.core.routing import SessionReleasingRoute
 from app.schemas.user_schemas import UserIn, UserOut, UserUpdate
 from app.services.user_service import UserService
 
-router = APIRouter()
+router = APIRouter(route_class=SessionReleasingRoute)
 
 
 @router.post('/users', response_model=UserOut, status_code=201)
@@ -1,4 +1,5 @@
-from datetime import datetime
+from datetime import date, datetime
+from enum import StrEnum
 from typing import Annotated
 
 from pydantic import BaseModel, Field
@@ -11,6 +12,14 @@ class RecordIn(BaseModel):
     category_id: int
 
 
+class RecordFilters(BaseModel):
+    category_id: int | None = None
+    min_amount: int | None = None
+    max_amount: int | None = None
+    date_from: datetime | None = None
+    date_to: datetime | None = None
+
+
 class CategoryOut(BaseModel):
     id: int
     name: str
@@ -30,3 +39,53 @@ class RecordWithCategoryOut(BaseModel):
     description: str
     date: datetime
     category: CategoryOut
+
+
+class RecordPageOut(BaseModel):
+    items: list[RecordWithCategoryOut]
+    next_cursor: str | None
+
+
+class ExportFormat(StrEnum):
+    CSV = 'csv'
+    NDJSON = 'ndjson'
+
+
+class RecordImportError(BaseModel):
+    row: int
+    detail: str
+
+
+class RecordImportOut(BaseModel):
+    accepted: int
+    rejected: list[RecordImportError]
+
+
+class SummaryGroupBy(StrEnum):
+    DAY = 'day'
+    WEEK = 'week'
+    MONTH = 'month'
+    CATEGORY = 'category'
+
+
+class RecordSummaryOut(BaseModel):
+    period: date | None = None
+    category: CategoryOut | None = None
+    total: int
+    count: int
+
+
+class BalancePeriod(StrEnum):
+    DAY = 'day'
+    MONTH = 'month'
+
+
+class RecordBalanceOut(BaseModel):
+    period: date
+    total: int
+    balance: int
+
+
+class RecordBalancePageOut(BaseModel):
+    items: list[RecordBalanceOut]
+    next_cursor: str | None
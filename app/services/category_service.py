@@ -1,10 +1,45 @@
-from sqlalchemy import or_, select
+import hashlib
+from typing import Mapping, NamedTuple, Sequence
 
-from app.core import exc
+from sqlalchemy.orm.attributes import set_committed_value
+
+from app.core import exc, settings
+from app.core.cache import TTLCache
+from app.core.db.postgres import on_commit
+from app.core.responses import compile_encoder, concat_json_arrays, dump_json
+from app.core.sec import invalidate_db_user
 from app.models.category import Category
 from app.models.user import User
 from app.repositories.category_repository import CategoryRepository
+from app.repositories.user_repository import UserRepository
 from app.schemas.category_schemas import CategoryIn
+from app.schemas.record_schemas import CategoryOut
+
+CATEGORIES_ENCODER = compile_encoder(list[CategoryOut])
+
+
+class PublicCategories(NamedTuple):
+    """The categories shared by all the users, also encoded as JSON, with
+    a digest of the encoded categories to version the listings"""
+
+    categories: tuple[CategoryOut, ...]
+    json: bytes
+    digest: str
+
+
+# The public categories are the same for everyone and almost never
+# change, so each process keeps them for a while. They are only changed
+# from commands (init_db), outside the API processes, so the changes
+# reach the workers when the cache expires
+PUBLIC_CATEGORIES_KEY = 'public'
+public_categories_cache: TTLCache[str, PublicCategories] = TTLCache(
+    maxsize=1, ttl=settings.cache.public_categories_ttl
+)
+# The categories each user can use in records (public and own), by id
+allowed_categories_cache: TTLCache[int, Mapping[int, CategoryOut]] = TTLCache(
+    maxsize=settings.cache.allowed_categories_maxsize,
+    ttl=settings.cache.allowed_categories_ttl,
+)
 
 
 class CategoryService:
@@ -13,45 +48,118 @@ class CategoryService:
         self.session = session
         self.max_categories_count = 5
         self.repository = CategoryRepository(session)
+        self.user_repository = UserRepository(session)
 
     async def create_category(self, data: CategoryIn) -> Category:
-        # Check if the user has reached the max categories count
-        if self.user.categories_count >= self.max_categories_count:
+        # Increment the user's categories count, unless the user has
+        # reached the max, in the same transaction as the insert
+        categories_count = (
+            await self.user_repository.increment_categories_count(
+                self.user.id, self.max_categories_count
+            )
+        )
+        if categories_count is None:
             raise exc.ForbiddenException('Max categories reached')
-        # Increment the user's categories count
-        self.user.categories_count += 1
-        self.session.add(self.user)
+        set_committed_value(self.user, 'categories_count', categories_count)
         # Create the category and return it
-        category = Category(**data.model_dump(), user_id=self.user.id)
-        created_category = await self.repository.save(category)
+        created_category = await self.repository.create({
+            **data.model_dump(),
+            'user_id': self.user.id,
+        })
+        on_commit(
+            self.session, allowed_categories_cache.invalidate, self.user.id
+        )
+        on_commit(self.session, invalidate_db_user, self.user.id)
         return created_category
 
-    async def get_categories(self) -> list[Category]:
-        # Get all categories that belong to the user or
-        # categories that do not belong to any user (public categories)
-        stmt = select(Category).where(
-            or_(
-                Category.user_id.is_(None),
-                Category.user_id == self.user.id,
-            )
+    async def get_categories(self) -> list[CategoryOut]:
+        # Get the categories that do not belong to any user (public
+        # categories) followed by the ones that belong to the user
+        public = await self.get_public_categories()
+        categories = await self.repository.get_by_user_id(self.user.id)
+        return [
+            *public.categories,
+            *(
+                CategoryOut.model_validate(category, from_attributes=True)
+                for category in categories
+            ),
+        ]
+
+    async def get_own_categories(self) -> Sequence[Category]:
+        """Get the categories of the user, to be encoded later along with
+        the public ones by `encode_categories`"""
+        return await self.repository.get_by_user_id(self.user.id)
+
+    @staticmethod
+    def encode_categories(
+        public: PublicCategories, categories: Sequence[Category]
+    ) -> bytes:
+        """Encode the public categories, which come already encoded, and
+        the ones from `get_own_categories` as a JSON array"""
+        return concat_json_arrays(
+            public.json, dump_json(categories, CATEGORIES_ENCODER)
         )
-        categories = await self.repository.get_all(stmt)
-        return categories
 
-    async def delete_category(self, category_id: int) -> Category:
-        category = await self._validate_category(category_id)
-        # Decrement the user's categories count
-        self.user.categories_count -= 1
-        self.session.add(self.user)
-        # Delete the category and return it
-        await self.repository.delete_instance(category)
-        return category
+    async def get_public_categories(self) -> PublicCategories:
+        """Get the public categories from the cache, loading them from
+        the database when they are missing or expired"""
+        public = public_categories_cache.get(PUBLIC_CATEGORIES_KEY)
+        if public is None:
+            version = public_categories_cache.version(PUBLIC_CATEGORIES_KEY)
+            categories = tuple(
+                CategoryOut.model_validate(category, from_attributes=True)
+                for category in await self.repository.get_public()
+            )
+            json = dump_json(categories, CATEGORIES_ENCODER)
+            digest = hashlib.blake2b(json, digest_size=8).hexdigest()
+            public = PublicCategories(categories, json, digest)
+            public_categories_cache.set(
+                PUBLIC_CATEGORIES_KEY, public, version=version
+            )
+        return public
 
-    async def _validate_category(self, category_id: int) -> Category:
-        """Check if the category exists and belongs to the user"""
-        category = await self.repository.get_by_id(category_id)
-        if not category or category.user_id != self.user.id:
+    async def get_allowed_categories(
+        self, category_id: int | None = None
+    ) -> Mapping[int, CategoryOut]:
+        """Get the categories the user can use in records by id, from the
+        cache when possible
+
+        Args:
+            category_id (int | None, optional): A category that should be
+            allowed, the categories are reloaded if it is not cached, as
+            it may have been created by another process. Defaults to None.
+
+        Returns:
+            Mapping[int, CategoryOut]: The allowed categories by id.
+        """
+        allowed = allowed_categories_cache.get(self.user.id)
+        if allowed is None or (
+            category_id is not None and category_id not in allowed
+        ):
+            version = allowed_categories_cache.version(self.user.id)
+            categories = await self.get_categories()
+            allowed = {category.id: category for category in categories}
+            allowed_categories_cache.set(
+                self.user.id, allowed, version=version
+            )
+        return allowed
+
+    async def delete_category(self, category_id: int) -> Category:
+        # Delete the category if it belongs to the user
+        category = await self.repository.delete_by_id(
+            category_id, Category.user_id == self.user.id
+        )
+        if not category:
             raise exc.NotFoundException(
                 'Category not found or invalid for this user'
             )
+        # Decrement the user's categories count
+        categories_count = (
+            await self.user_repository.decrement_categories_count(self.user.id)
+        )
+        set_committed_value(self.user, 'categories_count', categories_count)
+        on_commit(
+            self.session, allowed_categories_cache.invalidate, self.user.id
+        )
+        on_commit(self.session, invalidate_db_user, self.user.id)
         return category
@@ -1,67 +1,721 @@
-from sqlalchemy import select
+import csv
+import io
+import json
+from contextlib import contextmanager
+from datetime import date, datetime, time, timedelta, timezone
+from typing import AsyncIterator, Iterator, Sequence
+
+from pydantic import ValidationError
+from sqlalchemy import (
+    BigInteger,
+    Date,
+    Select,
+    and_,
+    exists,
+    func,
+    or_,
+    select,
+    tuple_,
+)
+from sqlalchemy.exc import IntegrityError
 from sqlalchemy.ext.asyncio import AsyncSession
 from sqlalchemy.orm import joinedload
+from sqlalchemy.orm.attributes import set_committed_value
+from zoneinfo import ZoneInfo, ZoneInfoNotFoundError
 
 from app.core import exc
+from app.core.db.postgres import async_session
 from app.models.category import Category
 from app.models.record import Record
+from app.models.record_rollup import RecordRollup
 from app.models.user import User
 from app.repositories.category_repository import CategoryRepository
 from app.repositories.record_repository import RecordRepository
-from app.schemas.record_schemas import RecordIn
+from app.repositories.record_rollup_repository import RecordRollupRepository
+from app.repositories.user_repository import UserRepository
+from app.schemas.record_schemas import (
+    BalancePeriod,
+    CategoryOut,
+    ExportFormat,
+    RecordFilters,
+    RecordIn,
+    SummaryGroupBy,
+)
+from app.services.category_service import (
+    CategoryService,
+    allowed_categories_cache,
+)
+from app.utils.functions import month_start
+from app.utils.pagination import decode_cursor, encode_cursor
+
+DEFAULT_SORT = '-date'
+# Whitelisted sort fields, with how their values are read from a cursor
+SORT_FIELDS = {
+    'date': datetime.fromisoformat,
+    'amount': int,
+    'id': int,
+}
+EXPORT_COLUMNS = ('id', 'date', 'amount', 'description', 'category')
+EXPORT_BATCH_SIZE = 1000
+IMPORT_BATCH_SIZE = 1000
+CSV_INTEGER_FIELDS = {'amount', 'category_id'}
+FOREIGN_KEY_VIOLATION = '23503'
 
 
 class RecordService:
     def __init__(self, session: AsyncSession, user: User) -> None:
         self.user = user
         self.session = session
+        self.max_import_rows = 10_000
         self.repository = RecordRepository(session)
+        self.rollup_repository = RecordRollupRepository(session)
+        self.user_repository = UserRepository(session)
 
     async def create_record(self, data: RecordIn) -> Record:
         category = await self._validate_category(data.category_id)
         # Create the record, attach the category and return it
-        record = Record(**data.model_dump(), user_id=self.user.id)
-        created_record = await self.repository.save(record)
-        created_record.category = category
+        with self._missing_category_not_found():
+            await self.rollup_repository.add_records(self.user.id, [data])
+            await self.user_repository.bump_data_version(self.user.id)
+            created_record = await self.repository.create({
+                **data.model_dump(),
+                'user_id': self.user.id,
+            })
+        # Attach the cached category without loading it from the database
+        set_committed_value(
+            created_record, 'category', Category(**category.model_dump())
+        )
         return created_record
 
+    async def create_records(self, data: list[RecordIn]) -> list[Record]:
+        """Create many records at once, all or nothing"""
+        category_ids = {record.category_id for record in data}
+        category_repository = CategoryRepository(self.session)
+        categories = {
+            category.id: category
+            for category in await category_repository.get_allowed_by_ids(
+                category_ids, self.user.id
+            )
+        }
+        if category_ids - categories.keys():
+            raise exc.NotFoundException(
+                'Category not found or invalid for this user'
+            )
+        # Create the records, attach the categories and return them
+        with self._missing_category_not_found():
+            await self.rollup_repository.add_records(self.user.id, data)
+            await self.user_repository.bump_data_version(self.user.id)
+            created_records = await self.repository.save_many([
+                {**record.model_dump(), 'user_id': self.user.id}
+                for record in data
+            ])
+        # Attach the loaded categories without marking the records dirty
+        for record in created_records:
+            set_committed_value(
+                record, 'category', categories[record.category_id]
+            )
+        return list(created_records)
+
+    async def import_records(self, rows: list[dict]) -> dict:
+        """Validate and insert many records at once, reporting the rows
+        that were rejected instead of failing the whole import"""
+        if len(rows) > self.max_import_rows:
+            raise exc.BadRequestException(
+                f'Too many rows, the max is {self.max_import_rows}'
+            )
+
+        rejected, valid = [], []
+        for row_number, row in enumerate(rows, start=1):
+            try:
+                valid.append((row_number, RecordIn.model_validate(row)))
+            except ValidationError as e:
+                rejected.append({
+                    'row': row_number,
+                    'detail': RecordService._format_errors(e),
+                })
+
+        # Check the ownership once per distinct category
+        category_ids = {record.category_id for _, record in valid}
+        category_repository = CategoryRepository(self.session)
+        categories = await category_repository.get_allowed_by_ids(
+            category_ids, self.user.id
+        )
+        allowed_ids = {category.id for category in categories}
+
+        accepted = []
+        for row_number, record in valid:
+            if record.category_id not in allowed_ids:
+                rejected.append({
+                    'row': row_number,
+                    'detail': 'Category not found or invalid for this user',
+                })
+                continue
+            accepted.append(record)
+
+        # Insert all the accepted records in a single transaction
+        with self._missing_category_not_found():
+            await self.rollup_repository.add_records(self.user.id, accepted)
+            if accepted:
+                await self.user_repository.bump_data_version(self.user.id)
+            await self.repository.bulk_insert(
+                [
+                    {**record.model_dump(), 'user_id': self.user.id}
+                    for record in accepted
+                ],
+                IMPORT_BATCH_SIZE,
+            )
+        rejected.sort(key=lambda error: error['row'])
+        return {'accepted': len(accepted), 'rejected': rejected}
+
     async def delete_record(self, record_id: int) -> Record:
-        # Check if the record to be deleted exists
-        record = await self.repository.get_by_id(record_id)
-        if not record:
+        # Delete the record if it belongs to the user
+        deleted_record = await self.repository.delete_by_id(
+            record_id, Record.user_id == self.user.id
+        )
+        if not deleted_record:
+            # Nothing deleted, tell a missing record from another user's
+            if await self.repository.get_by_id(record_id):
+                raise exc.UnauthorizedException(
+                    'You cannot delete this record'
+                )
             raise exc.NotFoundException('Record not found')
-        # Check if the record belongs to the user
-        if record.user_id != self.user.id:
-            raise exc.UnauthorizedException('You cannot delete this record')
-        # Delete the record and return it
-        deleted_record = await self.repository.delete_by_id(record_id)
+        # Subtract the record from the rollups in the same transaction
+        await self.rollup_repository.add_records(
+            self.user.id, [deleted_record], sign=-1
+        )
+        await self.user_repository.bump_data_version(self.user.id)
         return deleted_record
 
-    async def get_user_records(self, sort: str | None = None) -> list[Record]:
+    async def get_user_records(
+        self,
+        sort: str | None = None,
+        filters: RecordFilters | None = None,
+    ) -> list[Record]:
+        sort_keys = RecordService._parse_sort(sort)
+        stmt = self._user_records_stmt(filters).order_by(
+            *RecordService._order_by(sort_keys)
+        )
+        # Get all records for the user and return them
+        records = await self.repository.get_all(stmt)
+        return records
+
+    async def get_user_records_page(
+        self,
+        limit: int,
+        cursor: str | None = None,
+        sort: str | None = None,
+        filters: RecordFilters | None = None,
+    ) -> dict:
+        """Get a page of the user records using keyset pagination on the
+        sort fields and the id, so every page costs the same"""
+        sort_keys = RecordService._parse_sort(sort)
+        stmt = (
+            self._user_records_stmt(filters)
+            .order_by(*RecordService._order_by(sort_keys))
+            .limit(limit + 1)
+        )
+        if cursor:
+            values = RecordService._decode_record_cursor(cursor, sort_keys)
+            stmt = stmt.filter(RecordService._keyset_filter(sort_keys, values))
+        # Fetch one extra record to know if there is a next page
+        records = list(await self.repository.get_all(stmt))
+        next_cursor = None
+        if len(records) > limit:
+            records = records[:limit]
+            next_cursor = RecordService._encode_record_cursor(
+                records[-1], sort_keys
+            )
+
+        return {'items': records, 'next_cursor': next_cursor}
+
+    def _user_records_stmt(self, filters: RecordFilters | None) -> Select:
         stmt = (
             select(Record)
             .options(joinedload(Record.category))
             .filter(Record.user_id == self.user.id)
         )
-        if sort:
-            RecordService._apply_sorting_if_valid(stmt, sort)
-        # Get all records for the user and return them
+        if not filters:
+            return stmt
+        if filters.category_id is not None:
+            stmt = stmt.filter(Record.category_id == filters.category_id)
+        if filters.min_amount is not None:
+            stmt = stmt.filter(Record.amount >= filters.min_amount)
+        if filters.max_amount is not None:
+            stmt = stmt.filter(Record.amount <= filters.max_amount)
+        if filters.date_from is not None:
+            stmt = stmt.filter(Record.date >= filters.date_from)
+        if filters.date_to is not None:
+            stmt = stmt.filter(Record.date < filters.date_to)
+        return stmt
+
+    async def get_records_summary(
+        self,
+        group_by: SummaryGroupBy,
+        date_from: datetime | None = None,
+        date_to: datetime | None = None,
+        tz: str = 'UTC',
+    ) -> list[dict]:
+        """Get the total amount and count of the user records grouped by
+        category or by day, week or month in the given time zone"""
+        zone = RecordService._validate_timezone(tz)
+        if date_from:
+            date_from = RecordService._aware(date_from, zone)
+        if date_to:
+            date_to = RecordService._aware(date_to, zone)
+        # The monthly rollups answer in O(months) when the buckets match
+        if RecordService._can_use_rollups(group_by, zone, date_from, date_to):
+            return await self._get_rollups_summary(
+                group_by, date_from, date_to
+            )
+
+        filters = [Record.user_id == self.user.id]
+        if date_from:
+            filters.append(Record.date >= date_from)
+        if date_to:
+            filters.append(Record.date < date_to)
+        total = func.sum(Record.amount).label('total')
+        count = func.count().label('count')
+
+        if group_by == SummaryGroupBy.CATEGORY:
+            stmt = (
+                select(Category, total, count)
+                .join(Category, Record.category_id == Category.id)
+                .where(*filters)
+                .group_by(Category.id)
+                .order_by(total.desc())
+            )
+            return await self._get_category_summary(stmt)
+
+        # Local date of the start of the bucket each record belongs to
+        period = func.date_trunc(
+            group_by.value, func.timezone(tz, Record.date)
+        ).cast(Date)
+        stmt = (
+            select(period.label('period'), total, count)
+            .where(*filters)
+            .group_by('period')
+            .order_by('period')
+        )
+        result = await self.session.execute(stmt)
+        return [row._asdict() for row in result]
+
+    async def _get_rollups_summary(
+        self,
+        group_by: SummaryGroupBy,
+        date_from: datetime | None,
+        date_to: datetime | None,
+    ) -> list[dict]:
+        filters = [RecordRollup.user_id == self.user.id]
+        if date_from:
+            filters.append(RecordRollup.month >= month_start(date_from))
+        if date_to:
+            filters.append(RecordRollup.month < month_start(date_to))
+        total = func.sum(RecordRollup.total).cast(BigInteger).label('total')
+        count = func.sum(RecordRollup.count).label('count')
+
+        if group_by == SummaryGroupBy.CATEGORY:
+            stmt = (
+                select(Category, total, count)
+                .join(Category, RecordRollup.category_id == Category.id)
+                .where(*filters)
+                .group_by(Category.id)
+                .having(count > 0)
+                .order_by(total.desc())
+            )
+            return await self._get_category_summary(stmt)
+
+        stmt = (
+            select(RecordRollup.month.label('period'), total, count)
+            .where(*filters)
+            .group_by(RecordRollup.month)
+            .having(count > 0)
+            .order_by(RecordRollup.month)
+        )
+        result = await self.session.execute(stmt)
+        return [row._asdict() for row in result]
+
+    async def _get_category_summary(self, stmt: Select) -> list[dict]:
+        result = await self.session.execute(stmt)
+        return [
+            {'category': row.Category, 'total': row.total, 'count': row.count}
+            for row in result
+        ]
+
+    async def get_records_balance(  # noqa
+        self,
+        period: BalancePeriod,
+        date_from: datetime | None = None,
+        date_to: datetime | None = None,
+        tz: str = 'UTC',
+        limit: int = 100,
+        cursor: str | None = None,
+    ) -> dict:
+        """Get the total of each day or month in the given time zone and
+        the running balance up to it, a page at a time
+
+        Each page covers `limit` consecutive periods, from the first one
+        with records, so it only scans the records of its own range.
+        """
+        zone = RecordService._validate_timezone(tz)
+        filters = [Record.user_id == self.user.id]
+        if date_from:
+            filters.append(
+                Record.date >= RecordService._aware(date_from, zone)
+            )
+        if date_to:
+            filters.append(Record.date < RecordService._aware(date_to, zone))
+        # Continue after the last period of the previous page, starting
+        # from the balance it ended with
+        balance_carried = 0
+        if cursor:
+            last_period, balance_carried = (
+                RecordService._decode_balance_cursor(cursor)
+            )
+            next_start = RecordService._add_periods(last_period, period, 1)
+            filters.append(
+                Record.date >= datetime.combine(next_start, time(), zone)
+            )
+
+        # Skip the periods without records up to the first one with them
+        first_date = await self.session.scalar(
+            select(func.min(Record.date)).where(*filters)
+        )
+        if first_date is None:
+            return {'items': [], 'next_cursor': None}
+        start = RecordService._add_periods(
+            first_date.astimezone(zone).date(), period, 0
+        )
+        last_period = RecordService._add_periods(start, period, limit - 1)
+        end = datetime.combine(
+            RecordService._add_periods(start, period, limit), time(), zone
+        )
+
+        bucket = func.date_trunc(period.value, func.timezone(tz, Record.date))
+        totals = (
+            select(
+                bucket.cast(Date).label('period'),
+                func.sum(Record.amount).label('total'),
+            )
+            .where(
+                *filters,
+                Record.date >= datetime.combine(start, time(), zone),
+                Record.date < end,
+            )
+            .group_by('period')
+            .subquery()
+        )
+        balance = func.sum(totals.c.total).over(order_by=totals.c.period)
+        stmt = select(
+            totals.c.period,
+            totals.c.total,
+            (balance.cast(BigInteger) + balance_carried).label('balance'),
+        ).order_by(totals.c.period)
+        result = await self.session.execute(stmt)
+        items = [row._asdict() for row in result]
+
+        # Continue from the end of this page if there are records after it
+        next_cursor = None
+        has_more = await self.session.scalar(
+            select(exists().where(*filters, Record.date >= end))
+        )
+        if has_more:
+            next_cursor = encode_cursor([
+                last_period.isoformat(),
+                items[-1]['balance'],
+            ])
+
+        return {'items': items, 'next_cursor': next_cursor}
+
+    async def export_user_records(
+        self, export_format: ExportFormat
+    ) -> AsyncIterator[str]:
+        """Stream all the user records in the given format, batch by batch
+        from a server-side cursor, so memory stays flat
+
+        The request session is already closed when the response body is
+        streamed, so the export runs in its own session and transaction.
+        """
+        stmt = (
+            select(
+                Record.id,
+                Record.date,
+                Record.amount,
+                Record.description,
+                Category.name,
+            )
+            .join(Category, Record.category_id == Category.id)
+            .filter(Record.user_id == self.user.id)
+            .order_by(Record.date.desc(), Record.id.desc())
+        )
+        if export_format == ExportFormat.CSV:
+            yield RecordService._format_csv_rows([EXPORT_COLUMNS])
+
+        async with async_session() as session, session.begin():
+            # All the batches are read from the same snapshot
+            await session.connection(
+                execution_options={'isolation_level': 'REPEATABLE READ'}
+            )
+            result = await session.stream(stmt)
+            async for partition in result.partitions(EXPORT_BATCH_SIZE):
+                rows = [RecordService._export_values(r) for r in partition]
+                if export_format == ExportFormat.CSV:
+                    yield RecordService._format_csv_rows(rows)
+                else:
+                    yield RecordService._format_ndjson_rows(rows)
+
+    async def search_user_records(
+        self, query: str, limit: int = 20
+    ) -> list[Record]:
+        """Search the user records by description, matching substrings
+        and similar words (typos), most similar first"""
+        # Both operators are served by the trigram GIN index
+        pattern = f'%{RecordService._escape_like(query)}%'
+        stmt = (
+            select(Record)
+            .options(joinedload(Record.category))
+            .filter(
+                Record.user_id == self.user.id,
+                or_(
+                    Record.description.ilike(pattern, escape='\\'),
+                    Record.description.op('%>')(query),
+                ),
+            )
+            .order_by(
+                func.word_similarity(query, Record.description).desc(),
+                Record.date.desc(),
+                Record.id.desc(),
+            )
+            .limit(limit)
+        )
         records = await self.repository.get_all(stmt)
         return records
 
-    async def _validate_category(self, category_id: int) -> Category:
-        # Check if the category exists and belongs to the user
-        category_repository = CategoryRepository(self.session)
-        category = await category_repository.get_by_id(category_id)
-        if not category or category.user_id not in {None, self.user.id}:
+    async def _validate_category(self, category_id: int) -> CategoryOut:
+        # Check if the category exists and belongs to the user (or is
+        # public), through the user's cached allowed categories
+        category_service = CategoryService(self.session, self.user)
+        allowed = await category_service.get_allowed_categories(category_id)
+        category = allowed.get(category_id)
+        if not category:
             raise exc.NotFoundException(
                 'Category not found or invalid for this user'
             )
         return category
 
+    @contextmanager
+    def _missing_category_not_found(self) -> Iterator[None]:
+        """Report the records of a category deleted after it was checked
+        (by another process, while it was still cached here) as not found
+        instead of failing on the foreign key"""
+        try:
+            yield
+        except IntegrityError as e:
+            if getattr(e.orig, 'sqlstate', None) != FOREIGN_KEY_VIOLATION:
+                raise
+            allowed_categories_cache.invalidate(self.user.id)
+            raise exc.NotFoundException(
+                'Category not found or invalid for this user'
+            ) from e
+
+    @staticmethod
+    def _decode_balance_cursor(cursor: str) -> tuple[date, int]:
+        """Get the last period and balance from a balance cursor"""
+        values = decode_cursor(cursor)
+        try:
+            last_period, balance = values
+            return date.fromisoformat(last_period), int(balance)
+        except (TypeError, ValueError):
+            raise exc.BadRequestException('Invalid cursor')
+
+    @staticmethod
+    def _add_periods(value: date, period: BalancePeriod, count: int) -> date:
+        """Get the start of the period `count` periods after the one the
+        date belongs to"""
+        if period == BalancePeriod.DAY:
+            return value + timedelta(days=count)
+        month = value.month - 1 + count
+        return date(value.year + month // 12, month % 12 + 1, 1)
+
+    @staticmethod
+    def _can_use_rollups(
+        group_by: SummaryGroupBy,
+        zone: ZoneInfo,
+        date_from: datetime | None,
+        date_to: datetime | None,
+    ) -> bool:
+        """The rollups are by UTC month, so they can only be used for
+        month or category buckets in UTC between whole months"""
+        if group_by not in {SummaryGroupBy.MONTH, SummaryGroupBy.CATEGORY}:
+            return False
+        if zone.key != 'UTC':
+            return False
+        return all(
+            value is None
+            or value.astimezone(timezone.utc)
+            == datetime.combine(month_start(value), time(), timezone.utc)
+            for value in (date_from, date_to)
+        )
+
+    @staticmethod
+    def _escape_like(value: str) -> str:
+        """Escape the LIKE wildcards, using backslash as escape char"""
+        for char in ('\\', '%', '_'):
+            value = value.replace(char, f'\\{char}')
+        return value
+
+    @staticmethod
+    def _validate_timezone(tz: str) -> ZoneInfo:
+        try:
+            return ZoneInfo(tz)
+        except (ZoneInfoNotFoundError, ValueError):
+            raise exc.BadRequestException('Invalid time zone')
+
     @staticmethod
-    def _apply_sorting_if_valid(stmt: select, sort: str) -> None:
-        """Apply sorting if valid sort parameter is provided"""
-        match sort:
-            case _:
-                stmt = stmt.order_by(Record.date.desc())
+    def _aware(value: datetime, zone: ZoneInfo) -> datetime:
+        """Dates without time zone are taken as local to the given zone"""
+        if value.tzinfo is None:
+            return value.replace(tzinfo=zone)
+        return value
+
+    @staticmethod
+    def parse_import_body(body: bytes, content_type: str) -> list[dict]:
+        """Parse the rows of a records import from a CSV (with a header)
+        or a JSON array body"""
+        try:
+            if content_type.startswith('text/csv'):
+                rows = list(csv.DictReader(io.StringIO(body.decode())))
+                # CSV values are strings, but the integer fields are strict
+                for row in rows:
+                    for field in CSV_INTEGER_FIELDS & row.keys():
+                        row[field] = RecordService._coerce_int(row[field])
+                return rows
+            rows = json.loads(body)
+        except (ValueError, csv.Error):
+            raise exc.BadRequestException('Invalid import file')
+
+        if not isinstance(rows, list):
+            raise exc.BadRequestException('Expected a JSON array of records')
+        return rows
+
+    @staticmethod
+    def _coerce_int(value: str) -> int | str:
+        try:
+            return int(value)
+        except (TypeError, ValueError):
+            return value
+
+    @staticmethod
+    def _format_errors(error: ValidationError) -> str:
+        return '; '.join(
+            f'{".".join(map(str, e["loc"]))}: {e["msg"]}'
+            if e['loc']
+            else e['msg']
+            for e in error.errors()
+        )
+
+    @staticmethod
+    def _export_values(row: Sequence) -> tuple:
+        record_id, date, amount, description, category = row
+        return record_id, date.isoformat(), amount, description, category
+
+    @staticmethod
+    def _format_csv_rows(rows: Sequence[Sequence]) -> str:
+        buffer = io.StringIO()
+        csv.writer(buffer).writerows(rows)
+        return buffer.getvalue()
+
+    @staticmethod
+    def _format_ndjson_rows(rows: Sequence[Sequence]) -> str:
+        return ''.join(
+            json.dumps(dict(zip(EXPORT_COLUMNS, row))) + '\n' for row in rows
+        )
+
+    @staticmethod
+    def _parse_sort(sort: str | None) -> list[tuple[str, bool]]:
+        """Parse a sort parameter like '-date,amount' into the whitelisted
+        (field, descending) keys, ending with the id as a tiebreaker
+
+        Raises:
+            exc.BadRequestException: if a field cannot be sorted by
+        """
+        sort_keys = []
+        for field in (sort or DEFAULT_SORT).split(','):
+            name = field.strip().removeprefix('-')
+            if name not in SORT_FIELDS or name in dict(sort_keys):
+                raise exc.BadRequestException(f'Invalid sort field: {field}')
+            sort_keys.append((name, field.strip().startswith('-')))
+        # The id makes the order total, which keyset pagination needs
+        if 'id' not in dict(sort_keys):
+            sort_keys.append(('id', sort_keys[-1][1]))
+        return sort_keys
+
+    @staticmethod
+    def _order_by(sort_keys: list[tuple[str, bool]]) -> list:
+        return [
+            getattr(Record, name).desc()
+            if descending
+            else getattr(Record, name)
+            for name, descending in sort_keys
+        ]
+
+    @staticmethod
+    def _keyset_filter(sort_keys: list[tuple[str, bool]], values: list):
+        """Filter the records that come after the keyset values in the
+        order of the sort keys"""
+        columns = [getattr(Record, name) for name, _ in sort_keys]
+        directions = {descending for _, descending in sort_keys}
+        # Same direction for every key, a row comparison the index serves
+        if len(directions) == 1:
+            if directions.pop():
+                return tuple_(*columns) < tuple_(*values)
+            return tuple_(*columns) > tuple_(*values)
+        # Mixed directions: (a > x) OR (a = x AND b < y) OR ...
+        return or_(
+            *(
+                and_(
+                    *(columns[j] == values[j] for j in range(i)),
+                    columns[i] < values[i]
+                    if descending
+                    else columns[i] > values[i],
+                )
+                for i, (_, descending) in enumerate(sort_keys)
+            )
+        )
+
+    @staticmethod
+    def _encode_record_cursor(
+        record: Record, sort_keys: list[tuple[str, bool]]
+    ) -> str:
+        """Create a cursor with the keyset values of the record, tied to
+        the sort it was created for"""
+        values = [getattr(record, name) for name, _ in sort_keys]
+        return encode_cursor([
+            RecordService._format_sort(sort_keys),
+            *(
+                value.isoformat() if isinstance(value, datetime) else value
+                for value in values
+            ),
+        ])
+
+    @staticmethod
+    def _decode_record_cursor(
+        cursor: str, sort_keys: list[tuple[str, bool]]
+    ) -> list:
+        """Get the keyset values from a records cursor"""
+        sort, *values = decode_cursor(cursor) or [None]
+        if sort != RecordService._format_sort(sort_keys):
+            raise exc.BadRequestException('Invalid cursor')
+        try:
+            return [
+                SORT_FIELDS[name](value)
+                for (name, _), value in zip(sort_keys, values, strict=True)
+            ]
+        except (TypeError, ValueError):
+            raise exc.BadRequestException('Invalid cursor')
+
+    @staticmethod
+    def _format_sort(sort_keys: list[tuple[str, bool]]) -> str:
+        return ','.join(
+            f'-{name}' if descending else name
+            for name, descending in sort_keys
+        )
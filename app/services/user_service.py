@@ -1,6 +1,8 @@
 from sqlalchemy.ext.asyncio import AsyncSession
 
-from app.core import exc
+from app.core import exc, log
+from app.core.db.postgres import on_commit
+from app.core.sec import SecurityService, invalidate_db_user
 from app.models.user import User
 from app.repositories.user_repository import UserRepository
 from app.schemas.user_schemas import UserIn, UserUpdate
@@ -12,13 +14,17 @@ class UserService:
         self.repository = UserRepository(session)
 
     async def create_user(self, data: UserIn) -> User:
-        user = User(**data.model_dump())
-
-        # Check if email is already in use by another user
-        if await self.email_in_use(user.email):
+        # Hash the password in the hashing pool, before the session checks
+        # out a connection, so the hashing never holds a pool slot
+        password = await SecurityService.get_password_hash_async(data.password)
+        # Create the user unless the email is already in use, with a
+        # single statement that is safe against concurrent signups
+        created_user = await self.repository.create_unless_email_exists({
+            **data.model_dump(exclude={'password'}),
+            'password': password,
+        })
+        if created_user is None:
             raise exc.BadRequestException('Email already in use')
-        # Create the user and return it
-        created_user = await self.repository.save(user)
         return created_user
 
     async def update_user(
@@ -31,17 +37,34 @@ class UserService:
         if user_id != current_user.id:
             raise exc.UnauthorizedException('You cannot update this user')
         # Update the user and return it
-        updated_user = await self.repository.update(current_user, data)
+        updated_user = await self.repository.update_by_id(user_id, data)
+        on_commit(self.session, invalidate_db_user, user_id)
         return updated_user
 
-    async def email_in_use(self, email: str) -> bool:
-        """Check if an email is already in use
+    async def rehash_password(
+        self, user_id: int, old_hash: str, plain_password: str
+    ) -> bool:
+        """Upgrade a password hash to the current Argon2 parameters
 
         Args:
-            email (str): The email to be checked
+            user_id (int): The id of the user.
+            old_hash (str): The hash checked against the password.
+            plain_password (str): The password that matched the hash.
 
         Returns:
-            bool: True if email is in use, False otherwise
+            bool: True if the hash was upgraded, False otherwise.
         """
-        user = await self.repository.get_by_email(email)
-        return True if user else False
+        try:
+            new_hash = await SecurityService.get_password_hash_async(
+                plain_password
+            )
+        except exc.ServiceUnavailableException:
+            # Busy hashing pool, it will be tried again on the next login
+            log.warning(f'Skipping password rehash of user {user_id}')
+            return False
+        replaced = await self.repository.replace_password_hash(
+            user_id, old_hash, new_hash
+        )
+        if replaced:
+            on_commit(self.session, invalidate_db_user, user_id)
+        return replaced
@@ -1,6 +1,14 @@
-from datetime import datetime, timezone
+from datetime import date, datetime, timezone
 
 
 def update_model_timestamp(_mapper, _connection, target):
     """Updates model.updated_at field before update the model"""
     target.updated_at = datetime.now(timezone.utc)
+
+
+def month_start(value: datetime) -> date:
+    """Gets the first day of the UTC month of a datetime, naive datetimes
+    are taken as UTC"""
+    if value.tzinfo is not None:
+        value = value.astimezone(timezone.utc)
+    return value.date().replace(day=1)
@@ -0,0 +1,28 @@
+import base64
+import json
+
+from app.core import exc
+
+
+def encode_cursor(values: list) -> str:
+    """Encodes the keyset values of the last row of a page into an
+    opaque, url-safe cursor"""
+    raw = json.dumps(values, separators=(',', ':')).encode()
+    return base64.urlsafe_b64encode(raw).decode().rstrip('=')
+
+
+def decode_cursor(cursor: str) -> list:
+    """Decodes a cursor created by `encode_cursor`
+
+    Raises:
+        exc.BadRequestException: if the cursor is malformed
+    """
+    try:
+        padding = '=' * (-len(cursor) % 4)
+        values = json.loads(base64.urlsafe_b64decode(cursor + padding))
+    except ValueError:
+        raise exc.BadRequestException('Invalid cursor')
+
+    if not isinstance(values, list):
+        raise exc.BadRequestException('Invalid cursor')
+    return values
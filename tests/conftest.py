@@ -5,6 +5,7 @@ import pytest_asyncio
 from httpx import ASGITransport, AsyncClient
 from sqlalchemy import NullPool, text
 
+from app.core.cache import clear_caches
 from app.core.db.postgres import (
     DATABASE_URI,
     AsyncSession,
@@ -72,6 +73,7 @@ async def session(async_engine):
     finally:
         await truncate_all_tables(session)
         await session.close()
+        clear_caches()
 
 
 @pytest_asyncio.fixture()
@@ -86,9 +88,11 @@ async def client(session):
 @pytest_asyncio.fixture()
 async def user(session):
     user_service = UserService(session)
-    return await user_service.create_user(
+    user = await user_service.create_user(
         UserIn(email='testuser@ex.com', name='User Name', password='Pass12345')
     )
+    await session.commit()
+    return user
 
 
 @pytest_asyncio.fixture()
@@ -1,5 +1,6 @@
 import pytest
 
+from app.core.sec import PasswordHash, SecurityService
 from app.models import User
 
 
@@ -57,3 +58,17 @@ async def test_user_password_field_is_hashed(session):
     await session.refresh(user)
 
     assert user.password != 'Password123'
+
+
+@pytest.mark.asyncio()
+async def test_user_password_field_keeps_hashed_password(session):
+    hashed = await SecurityService.get_password_hash_async('Password123')
+    assert isinstance(hashed, PasswordHash)
+    user = User(
+        name='André Lopes',
+        email='andrelopes@gmail.com',
+        password=hashed,
+    )
+
+    assert user.password == hashed
+    assert user.verify_password('Password123')
@@ -1,6 +1,15 @@
+import asyncio
+import time
+from collections import Counter
 from http import HTTPStatus
 
 import pytest
+from sqlalchemy import func, select
+
+from app.core.db.postgres import async_session
+from app.models import Category
+from app.models.user import User
+from app.services.category_service import public_categories_cache
 
 
 @pytest.mark.asyncio()
@@ -44,3 +53,81 @@ async def test_delete_category(client, authorization_header):
     )
 
     assert response.status_code == HTTPStatus.OK
+
+
+@pytest.mark.asyncio()
+async def test_get_categories_not_modified(client, authorization_header):
+    response = await client.get('/categories', headers=authorization_header)
+    etag = response.headers['ETag']
+
+    headers = {**authorization_header, 'If-None-Match': etag}
+    response = await client.get('/categories', headers=headers)
+    assert response.status_code == HTTPStatus.NOT_MODIFIED
+    assert response.headers['ETag'] == etag
+
+    # A write bumps the data version and so changes the etag
+    category_data = dict(name='Test', description='Test description')
+    await client.post(
+        '/categories', json=category_data, headers=authorization_header
+    )
+    response = await client.get('/categories', headers=headers)
+    assert response.status_code == HTTPStatus.OK
+    assert response.headers['ETag'] != etag
+    assert len(response.json()) == 1
+
+
+@pytest.mark.asyncio()
+async def test_get_categories_etag_follows_public_categories(
+    client, authorization_header
+):
+    response = await client.get('/categories', headers=authorization_header)
+    etag = response.headers['ETag']
+
+    # A new public category shows up once the cached ones expire, and
+    # changes the etag even though the user data did not change
+    async with async_session() as session:
+        session.add(Category(name='Public', description='Public'))
+        await session.commit()
+    public_categories_cache.clear()
+
+    headers = {**authorization_header, 'If-None-Match': etag}
+    response = await client.get('/categories', headers=headers)
+    assert response.status_code == HTTPStatus.OK
+    assert response.headers['ETag'] != etag
+    assert [category['name'] for category in response.json()] == ['Public']
+
+
+@pytest.mark.asyncio()
+async def test_create_categories_concurrently(
+    client, user, authorization_header, record_property
+):
+    requests_count = 50
+    category_data = dict(name='Test', description='Test description')
+
+    async def create_category():
+        response = await client.post(
+            '/categories', json=category_data, headers=authorization_header
+        )
+        return response.status_code
+
+    start = time.perf_counter()
+    status_codes = await asyncio.gather(
+        *(create_category() for _ in range(requests_count))
+    )
+    elapsed = time.perf_counter() - start
+    # Reported in the JUnit XML report (--junitxml) to track it over time
+    record_property('categories_per_second', round(requests_count / elapsed))
+
+    # The quota holds, whatever the order the requests ran in
+    assert Counter(status_codes) == {
+        HTTPStatus.CREATED: 5,
+        HTTPStatus.FORBIDDEN: requests_count - 5,
+    }
+    async with async_session() as session:
+        categories = await session.scalar(
+            select(func.count()).where(Category.user_id == user.id)
+        )
+        categories_count = await session.scalar(
+            select(User.categories_count).where(User.id == user.id)
+        )
+    assert categories == categories_count == 5  # noqa
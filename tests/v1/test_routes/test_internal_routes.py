@@ -0,0 +1,81 @@
+from http import HTTPStatus
+
+import pytest
+
+from app.core import sec
+
+METRICS_URL = 'http://localhost:8000/internal/metrics'
+
+
+@pytest.fixture()
+def internal_headers(monkeypatch):
+    monkeypatch.setattr(sec, 'INTERNAL_TOKEN', 'internal-token')
+    return {'X-Internal-Token': 'internal-token'}
+
+
+@pytest.mark.asyncio()
+async def test_get_pool_metrics(
+    client, authorization_header, internal_headers
+):
+    await client.get('/users/me', headers=authorization_header)
+
+    response = await client.get(
+        f'{METRICS_URL}/pool', headers=internal_headers
+    )
+
+    data = response.json()
+    assert response.status_code == HTTPStatus.OK
+    assert data['checked_out'] == 0
+    assert data['size'] > 0
+    wait = data['wait_seconds']
+    assert wait['count'] > 0
+    assert wait['buckets']['+Inf'] == wait['count']
+
+
+@pytest.mark.asyncio()
+async def test_get_replica_metrics_without_replica(client, internal_headers):
+    response = await client.get(
+        f'{METRICS_URL}/replica', headers=internal_headers
+    )
+
+    assert response.status_code == HTTPStatus.OK
+    assert response.json() == {'enabled': False}
+
+
+@pytest.mark.asyncio()
+async def test_get_cache_metrics(
+    client, authorization_header, internal_headers
+):
+    await client.get('/users/me', headers=authorization_header)
+    await client.get('/users/me', headers=authorization_header)
+
+    response = await client.get(
+        f'{METRICS_URL}/caches', headers=internal_headers
+    )
+
+    data = response.json()
+    assert response.status_code == HTTPStatus.OK
+    assert data['tokens']['hits'] > 0
+    assert data['users']['hits'] > 0
+    assert set(data['allowed_categories']) == {'size', 'hits', 'misses'}
+
+
+@pytest.mark.asyncio()
+async def test_get_metrics_requires_the_internal_token(
+    client, internal_headers
+):
+    response = await client.get(f'{METRICS_URL}/pool')
+    assert response.status_code == HTTPStatus.UNAUTHORIZED
+
+    response = await client.get(
+        f'{METRICS_URL}/pool', headers={'X-Internal-Token': 'wrong'}
+    )
+    assert response.status_code == HTTPStatus.UNAUTHORIZED
+
+
+@pytest.mark.asyncio()
+async def test_get_metrics_disabled_without_internal_token(client):
+    response = await client.get(
+        f'{METRICS_URL}/pool', headers={'X-Internal-Token': ''}
+    )
+    assert response.status_code == HTTPStatus.NOT_FOUND
@@ -1,8 +1,17 @@
+import json
 from datetime import datetime, timezone
 from http import HTTPStatus
 
 import pytest
 from httpx import AsyncClient
+from pydantic import TypeAdapter
+from sqlalchemy import delete
+
+from app.core.db.postgres import async_session
+from app.models import Category
+from app.repositories.user_repository import UserRepository
+from app.schemas.record_schemas import RecordPageOut, RecordWithCategoryOut
+from app.services.category_service import CategoryService
 
 
 @pytest.mark.asyncio()
@@ -59,6 +68,93 @@ async def test_get_records(user_category_autheaders, client: AsyncClient):
     assert len(response.json()) == expected_size
 
 
+@pytest.mark.asyncio()
+async def test_get_records_matches_schema_serialization(
+    user_category_autheaders, client: AsyncClient
+):
+    # (User, Category, Authorization Headers)
+    _, category, headers = user_category_autheaders
+    record_data = dict(
+        amount=10,
+        description='vaquinha',
+        category_id=category.id,
+        date=datetime.now(timezone.utc).isoformat(),
+    )
+    await client.post(url='/records', headers=headers, json=record_data)
+
+    response = await client.get('/records', headers=headers)
+    page_response = await client.get('/records?limit=1', headers=headers)
+
+    # Same output as the default pydantic serialization of the schemas
+    adapter = TypeAdapter(list[RecordWithCategoryOut])
+    records = adapter.validate_json(response.content)
+    assert response.json() == json.loads(adapter.dump_json(records))
+    page = RecordPageOut.model_validate_json(page_response.content)
+    assert page_response.json() == json.loads(page.model_dump_json())
+    assert response.json()[0]['date'].endswith('Z')
+
+
+@pytest.mark.asyncio()
+async def test_get_records_not_modified(
+    user_category_autheaders, client: AsyncClient
+):
+    _, category, headers = user_category_autheaders
+    record_data = dict(
+        amount=10,
+        description='vaquinha',
+        category_id=category.id,
+        date=datetime.now(timezone.utc).isoformat(),
+    )
+    await client.post(url='/records', headers=headers, json=record_data)
+
+    response = await client.get('/records', headers=headers)
+    etag = response.headers['ETag']
+    response = await client.get(
+        '/records', headers={**headers, 'If-None-Match': etag}
+    )
+    assert response.status_code == HTTPStatus.NOT_MODIFIED
+    assert not response.content
+
+    # Each query has its own etag
+    response = await client.get(
+        '/records?limit=1', headers={**headers, 'If-None-Match': etag}
+    )
+    assert response.status_code == HTTPStatus.OK
+
+    # And a write changes all of them
+    created = await client.post(
+        url='/records', headers=headers, json=record_data
+    )
+    await client.delete(f'/records/{created.json()["id"]}', headers=headers)
+    response = await client.get(
+        '/records', headers={**headers, 'If-None-Match': etag}
+    )
+    assert response.status_code == HTTPStatus.OK
+    assert response.headers['ETag'] != etag
+
+
+@pytest.mark.asyncio()
+async def test_get_records_sees_writes_of_other_processes(
+    user_category_autheaders, client: AsyncClient
+):
+    user, _, headers = user_category_autheaders
+    # Caches the user snapshot
+    response = await client.get('/records', headers=headers)
+    etag = response.headers['ETag']
+
+    # A write made by another process, which cannot invalidate the caches
+    # of this one
+    async with async_session() as session:
+        await UserRepository(session).bump_data_version(user.id)
+        await session.commit()
+
+    response = await client.get(
+        '/records', headers={**headers, 'If-None-Match': etag}
+    )
+    assert response.status_code == HTTPStatus.OK
+    assert response.headers['ETag'] != etag
+
+
 @pytest.mark.asyncio()
 async def test_delete_record(user_category_autheaders, client: AsyncClient):
     # (User, Category, Authorization Headers)
@@ -131,6 +227,38 @@ async def test_create_record_with_invalid_category(
     }
 
 
+@pytest.mark.asyncio()
+async def test_create_record_with_category_deleted_elsewhere(
+    user_category_autheaders, client: AsyncClient
+):
+    user, category, headers = user_category_autheaders
+    # Caches the category as allowed for the user
+    async with async_session() as session:
+        await CategoryService(session, user).get_allowed_categories()
+
+    # Deleted by another process, which cannot invalidate this cache
+    async with async_session() as session:
+        await session.execute(delete(Category).filter_by(id=category.id))
+        await session.commit()
+
+    record_data = dict(
+        amount=10,
+        description='vaquinha',
+        category_id=category.id,
+        date=datetime.now(timezone.utc).isoformat(),
+    )
+    response = await client.post(
+        url='/records',
+        headers=headers,
+        json=record_data,
+    )
+
+    assert response.status_code == HTTPStatus.NOT_FOUND
+    assert response.json() == {
+        'detail': 'Category not found or invalid for this user'
+    }
+
+
 @pytest.mark.asyncio()
 async def test_create_record_with_invalid_description_length(
     user_category_autheaders, client: AsyncClient
@@ -150,3 +278,424 @@ async def test_create_record_with_invalid_description_length(
 
     assert response.status_code == HTTPStatus.UNPROCESSABLE_ENTITY
     assert response.json()['detail'][0]['loc'] == ['body', 'description']
+
+
+@pytest.mark.asyncio()
+async def test_get_records_paginated(
+    user_category_autheaders, client: AsyncClient
+):
+    _, category, headers = user_category_autheaders
+    # Create records
+    for i in range(5):
+        record_data = dict(
+            amount=i + 1,
+            description=f'vaquinha {i}',
+            category_id=category.id,
+            date=datetime(2024, 1, i + 1, tzinfo=timezone.utc).isoformat(),
+        )
+        await client.post(url='/records', headers=headers, json=record_data)
+
+    # Walk through all the pages
+    ids, cursor = [], None
+    while True:
+        params = {'limit': 2}
+        if cursor:
+            params['cursor'] = cursor
+        response = await client.get('/records', headers=headers, params=params)
+        assert response.status_code == HTTPStatus.OK
+        page = response.json()
+        ids.extend(record['id'] for record in page['items'])
+        cursor = page['next_cursor']
+        if not cursor:
+            break
+
+    # Newest records first and no duplicated records between pages
+    assert ids == [5, 4, 3, 2, 1]
+
+
+@pytest.mark.asyncio()
+async def test_get_records_with_invalid_cursor(
+    user_category_autheaders, client: AsyncClient
+):
+    _, _, headers = user_category_autheaders
+    response = await client.get(
+        '/records', headers=headers, params={'cursor': 'invalid'}
+    )
+
+    assert response.status_code == HTTPStatus.BAD_REQUEST
+    assert response.json() == {'detail': 'Invalid cursor'}
+
+
+@pytest.mark.asyncio()
+async def test_export_records(user_category_autheaders, client: AsyncClient):
+    _, category, headers = user_category_autheaders
+    record_data = dict(
+        amount=20,
+        description='vaquinha',
+        category_id=category.id,
+        date=datetime(2024, 1, 1, tzinfo=timezone.utc).isoformat(),
+    )
+    await client.post(url='/records', headers=headers, json=record_data)
+
+    response = await client.get('/records/export', headers=headers)
+    assert response.status_code == HTTPStatus.OK
+    assert response.headers['content-type'].startswith('text/csv')
+    assert response.text.splitlines() == [
+        'id,date,amount,description,category',
+        f'1,2024-01-01T00:00:00+00:00,20,vaquinha,{category.name}',
+    ]
+
+    response = await client.get(
+        '/records/export', headers=headers, params={'format': 'ndjson'}
+    )
+    assert response.status_code == HTTPStatus.OK
+    assert [json.loads(line) for line in response.text.splitlines()] == [
+        {
+            'id': 1,
+            'date': '2024-01-01T00:00:00+00:00',
+            'amount': 20,
+            'description': 'vaquinha',
+            'category': category.name,
+        }
+    ]
+
+
+@pytest.mark.asyncio()
+async def test_import_records_json(
+    user_category_autheaders, client: AsyncClient
+):
+    _, category, headers = user_category_autheaders
+    date = datetime.now(timezone.utc).isoformat()
+    rows = [
+        dict(amount=10, description='a', category_id=category.id, date=date),
+        dict(amount=0, description='b', category_id=category.id, date=date),
+        dict(amount=30, description='c', category_id=123, date=date),
+        dict(amount=40, description='d', category_id=category.id, date=date),
+    ]
+
+    response = await client.post('/records/import', headers=headers, json=rows)
+    data = response.json()
+
+    assert response.status_code == HTTPStatus.OK
+    assert data['accepted'] == 2  # noqa
+    assert [error['row'] for error in data['rejected']] == [2, 3]
+    assert data['rejected'][1]['detail'] == (
+        'Category not found or invalid for this user'
+    )
+
+    response = await client.get('/records', headers=headers)
+    assert len(response.json()) == 2  # noqa
+
+
+@pytest.mark.asyncio()
+async def test_import_records_csv(
+    user_category_autheaders, client: AsyncClient
+):
+    _, category, headers = user_category_autheaders
+    body = (
+        'amount,description,date,category_id\n'
+        f'10,coffee,2024-01-01T10:00:00+00:00,{category.id}\n'
+        f'ten,coffee,2024-01-01T10:00:00+00:00,{category.id}\n'
+    )
+
+    response = await client.post(
+        '/records/import',
+        headers={**headers, 'Content-Type': 'text/csv'},
+        content=body,
+    )
+    data = response.json()
+
+    assert response.status_code == HTTPStatus.OK
+    assert data['accepted'] == 1
+    assert data['rejected'][0]['row'] == 2  # noqa
+    assert data['rejected'][0]['detail'].startswith('amount:')
+
+
+@pytest.mark.asyncio()
+async def test_import_records_invalid_body(
+    user_category_autheaders, client: AsyncClient
+):
+    _, _, headers = user_category_autheaders
+    response = await client.post(
+        '/records/import', headers=headers, json={'amount': 10}
+    )
+
+    assert response.status_code == HTTPStatus.BAD_REQUEST
+    assert response.json() == {'detail': 'Expected a JSON array of records'}
+
+
+@pytest.mark.asyncio()
+async def test_create_records_batch(
+    user_category_autheaders, client: AsyncClient
+):
+    _, category, headers = user_category_autheaders
+    records_data = [
+        dict(
+            amount=i + 1,
+            description=f'vaquinha {i}',
+            category_id=category.id,
+            date=datetime.now(timezone.utc).isoformat(),
+        )
+        for i in range(3)
+    ]
+
+    response = await client.post(
+        '/records/batch', headers=headers, json=records_data
+    )
+    data = response.json()
+
+    assert response.status_code == HTTPStatus.CREATED
+    assert [record['amount'] for record in data] == [1, 2, 3]
+    assert all(record['category']['id'] == category.id for record in data)
+
+
+@pytest.mark.asyncio()
+async def test_create_records_batch_with_invalid_category(
+    user_category_autheaders, client: AsyncClient
+):
+    _, category, headers = user_category_autheaders
+    records_data = [
+        dict(
+            amount=10,
+            description='vaquinha',
+            category_id=category_id,
+            date=datetime.now(timezone.utc).isoformat(),
+        )
+        for category_id in (category.id, 123)
+    ]
+
+    response = await client.post(
+        '/records/batch', headers=headers, json=records_data
+    )
+
+    assert response.status_code == HTTPStatus.NOT_FOUND
+    response = await client.get('/records', headers=headers)
+    assert response.json() == []
+
+
+@pytest.mark.asyncio()
+async def test_get_records_summary(
+    user_category_autheaders, client: AsyncClient
+):
+    _, category, headers = user_category_autheaders
+    # Two records in January (UTC) and one in February
+    for amount, date in [
+        (10, datetime(2024, 1, 10, 12, tzinfo=timezone.utc)),
+        (20, datetime(2024, 1, 31, 23, tzinfo=timezone.utc)),
+        (30, datetime(2024, 2, 15, 12, tzinfo=timezone.utc)),
+    ]:
+        record_data = dict(
+            amount=amount,
+            description='vaquinha',
+            category_id=category.id,
+            date=date.isoformat(),
+        )
+        await client.post(url='/records', headers=headers, json=record_data)
+
+    response = await client.get(
+        '/records/summary', headers=headers, params={'group_by': 'month'}
+    )
+    assert response.status_code == HTTPStatus.OK
+    assert response.json() == [
+        {'period': '2024-01-01', 'category': None, 'total': 30, 'count': 2},
+        {'period': '2024-02-01', 'category': None, 'total': 30, 'count': 1},
+    ]
+
+    # The last day of January is already February in Tokyo
+    response = await client.get(
+        '/records/summary',
+        headers=headers,
+        params={'group_by': 'month', 'tz': 'Asia/Tokyo', 'from': '2024-02-01'},
+    )
+    assert response.json() == [
+        {'period': '2024-02-01', 'category': None, 'total': 50, 'count': 2},
+    ]
+
+    response = await client.get(
+        '/records/summary', headers=headers, params={'group_by': 'category'}
+    )
+    assert response.json() == [
+        {
+            'period': None,
+            'category': {
+                'id': category.id,
+                'name': category.name,
+                'description': category.description,
+            },
+            'total': 60,
+            'count': 3,
+        }
+    ]
+
+
+@pytest.mark.asyncio()
+async def test_get_records_summary_with_invalid_timezone(
+    user_category_autheaders, client: AsyncClient
+):
+    _, _, headers = user_category_autheaders
+    response = await client.get(
+        '/records/summary',
+        headers=headers,
+        params={'group_by': 'day', 'tz': 'Mars/Olympus'},
+    )
+
+    assert response.status_code == HTTPStatus.BAD_REQUEST
+    assert response.json() == {'detail': 'Invalid time zone'}
+
+
+@pytest.mark.asyncio()
+async def test_get_records_balance(
+    user_category_autheaders, client: AsyncClient
+):
+    _, category, headers = user_category_autheaders
+    for amount, day in [(10, 1), (20, 1), (30, 3), (40, 4)]:
+        record_data = dict(
+            amount=amount,
+            description='vaquinha',
+            category_id=category.id,
+            date=datetime(2024, 1, day, 12, tzinfo=timezone.utc).isoformat(),
+        )
+        await client.post(url='/records', headers=headers, json=record_data)
+
+    # Walk through all the pages
+    items, cursor = [], None
+    while True:
+        params = {'period': 'day', 'limit': 2}
+        if cursor:
+            params['cursor'] = cursor
+        response = await client.get(
+            '/records/balance', headers=headers, params=params
+        )
+        assert response.status_code == HTTPStatus.OK
+        page = response.json()
+        items.extend(page['items'])
+        cursor = page['next_cursor']
+        if not cursor:
+            break
+
+    assert items == [
+        {'period': '2024-01-01', 'total': 30, 'balance': 30},
+        {'period': '2024-01-03', 'total': 30, 'balance': 60},
+        {'period': '2024-01-04', 'total': 40, 'balance': 100},
+    ]
+
+
+@pytest.mark.asyncio()
+async def test_get_records_balance_pages_skip_empty_periods(
+    user_category_autheaders, client: AsyncClient
+):
+    _, category, headers = user_category_autheaders
+    for amount, (year, month) in [
+        (10, (2023, 12)),
+        (20, (2024, 1)),
+        (30, (2024, 5)),
+    ]:
+        record_data = dict(
+            amount=amount,
+            description='vaquinha',
+            category_id=category.id,
+            date=datetime(year, month, 10, tzinfo=timezone.utc).isoformat(),
+        )
+        await client.post(url='/records', headers=headers, json=record_data)
+
+    # Each page covers two months, from the first one with records
+    pages, cursor = [], None
+    while True:
+        params = {'period': 'month', 'limit': 2}
+        if cursor:
+            params['cursor'] = cursor
+        response = await client.get(
+            '/records/balance', headers=headers, params=params
+        )
+        assert response.status_code == HTTPStatus.OK
+        page = response.json()
+        pages.append([item['period'] for item in page['items']])
+        cursor = page['next_cursor']
+        if not cursor:
+            break
+
+    assert pages == [['2023-12-01', '2024-01-01'], ['2024-05-01']]
+    assert page['items'] == [
+        {'period': '2024-05-01', 'total': 30, 'balance': 60}
+    ]
+
+
+@pytest.mark.asyncio()
+async def test_search_records(user_category_autheaders, client: AsyncClient):
+    _, category, headers = user_category_autheaders
+    for description in ['uber to airport', 'rent', 'uber eats', '100% off']:
+        record_data = dict(
+            amount=10,
+            description=description,
+            category_id=category.id,
+            date=datetime.now(timezone.utc).isoformat(),
+        )
+        await client.post(url='/records', headers=headers, json=record_data)
+
+    async def search(query):
+        response = await client.get(
+            '/records/search', headers=headers, params={'q': query}
+        )
+        assert response.status_code == HTTPStatus.OK
+        return sorted(record['description'] for record in response.json())
+
+    assert await search('uber') == ['uber eats', 'uber to airport']
+    # Similar words are found too
+    assert await search('uberr') == ['uber eats', 'uber to airport']
+    # Wildcards are matched literally
+    assert await search('%') == ['100% off']
+    assert await search('groceries') == []
+
+
+@pytest.mark.asyncio()
+async def test_get_records_sorted_and_filtered(
+    user_category_autheaders, client: AsyncClient
+):
+    _, category, headers = user_category_autheaders
+    for amount, day in [(30, 1), (10, 2), (20, 3), (10, 4)]:
+        record_data = dict(
+            amount=amount,
+            description='vaquinha',
+            category_id=category.id,
+            date=datetime(2024, 1, day, tzinfo=timezone.utc).isoformat(),
+        )
+        await client.post(url='/records', headers=headers, json=record_data)
+
+    async def get_ids(**params):
+        response = await client.get('/records', headers=headers, params=params)
+        assert response.status_code == HTTPStatus.OK
+        return [record['id'] for record in response.json()]
+
+    assert await get_ids() == [4, 3, 2, 1]
+    assert await get_ids(sort='amount,-date') == [4, 2, 3, 1]
+    assert await get_ids(sort='-amount', min_amount=15) == [1, 3]
+    date_range = {'from': '2024-01-02', 'to': '2024-01-04'}
+    assert await get_ids(**date_range) == [3, 2]
+    assert await get_ids(category_id=category.id + 1) == []
+
+    # Keyset pagination with mixed sort directions
+    ids, cursor = [], None
+    while True:
+        params = {'sort': 'amount,-date', 'limit': 1}
+        if cursor:
+            params['cursor'] = cursor
+        response = await client.get('/records', headers=headers, params=params)
+        page = response.json()
+        ids.extend(record['id'] for record in page['items'])
+        cursor = page['next_cursor']
+        if not cursor:
+            break
+    assert ids == [4, 2, 3, 1]
+
+
+@pytest.mark.asyncio()
+async def test_get_records_with_invalid_sort(
+    user_category_autheaders, client: AsyncClient
+):
+    _, _, headers = user_category_autheaders
+    response = await client.get(
+        '/records', headers=headers, params={'sort': 'description'}
+    )
+
+    assert response.status_code == HTTPStatus.BAD_REQUEST
+    assert response.json() == {'detail': 'Invalid sort field: description'}
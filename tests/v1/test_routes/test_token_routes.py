@@ -1,5 +1,9 @@
 import pytest
+from argon2 import PasswordHasher
 
+from app.core.db.postgres import engine
+from app.core.sec import PasswordHash, SecurityService
+from app.models.user import User
 from app.schemas.user_schemas import UserIn
 
 
@@ -21,6 +25,52 @@ async def test_get_token(client):
     assert 'token_type' in response.json()
 
 
+@pytest.mark.asyncio()
+async def test_get_token_releases_connection_before_verifying(
+    client, user, monkeypatch
+):
+    checked_out = []
+    verify_password_async = SecurityService.verify_password_async
+
+    async def verify_password(password, hashed_password):
+        checked_out.append(engine.pool.checkedout())
+        return await verify_password_async(password, hashed_password)
+
+    monkeypatch.setattr(
+        SecurityService, 'verify_password_async', verify_password
+    )
+    before = engine.pool.checkedout()
+    login_data = {'username': 'testuser@ex.com', 'password': 'Pass12345'}
+    response = await client.post('/auth/token', data=login_data)
+    assert response.status_code == 200  # noqa
+
+    # The request connection was back in the pool while hashing
+    assert checked_out == [before]
+
+
+@pytest.mark.asyncio()
+async def test_get_token_rehashes_outdated_password(client, session):
+    # A hash made with weaker parameters than the current ones
+    old_hash = PasswordHasher(time_cost=1, memory_cost=8192).hash('Pass12345')
+    user = User(
+        name='testuser',
+        email='testuser@example.com',
+        password=PasswordHash(old_hash),
+    )
+    session.add(user)
+    await session.commit()
+
+    login_data = {'username': 'testuser@example.com', 'password': 'Pass12345'}
+    response = await client.post('/auth/token', data=login_data)
+    assert response.status_code == 200  # noqa
+
+    # Upgraded by a background task after the response
+    await session.refresh(user)
+    assert user.password != old_hash
+    assert not SecurityService.password_needs_rehash(user.password)
+    assert SecurityService.verify_password('Pass12345', user.password)
+
+
 @pytest.mark.asyncio()
 async def test_get_token_fail(client):
     new_user = UserIn(
@@ -1,6 +1,10 @@
+import asyncio
+from collections import Counter
+
 import pytest
 from httpx import AsyncClient
 
+from app.core.sec import USER_CACHE
 from app.schemas.user_schemas import UserIn, UserOut, UserUpdate
 
 
@@ -23,6 +27,30 @@ async def test_create_user(client: AsyncClient):
     assert returned_user.email == new_user.email
 
 
+@pytest.mark.asyncio()
+async def test_create_users_with_the_same_email_concurrently(
+    client: AsyncClient,
+):
+    new_user = UserIn(
+        name='User Name', email='testuser@example.com', password='Pass12345'
+    )
+
+    responses = await asyncio.gather(
+        *(client.post('/users', json=new_user.model_dump()) for _ in range(5))
+    )
+
+    # Only one signup wins, the others see the email in use
+    assert Counter(response.status_code for response in responses) == {
+        201: 1,
+        400: 4,
+    }
+    assert {
+        response.json()['detail']
+        for response in responses
+        if response.status_code == 400  # noqa
+    } == {'Email already in use'}
+
+
 @pytest.mark.asyncio()
 async def test_create_user_with_invalid_password(client: AsyncClient):
     # Create a new user
@@ -118,3 +146,62 @@ async def test_update_user_route(client):
     # Assert that the returned user matches the updated user
     returned_user = UserOut(**response.json())
     assert returned_user.name == updated_user.name
+
+
+@pytest.mark.asyncio()
+async def test_get_current_user_is_cached_until_updated(
+    client: AsyncClient, user_category_autheaders, authorization_header
+):
+    user, category, _ = user_category_autheaders
+    response = await client.get('/users/me', headers=authorization_header)
+    assert response.json()['name'] == user.name
+
+    # Served from the cached snapshot of the user
+    hits = USER_CACHE.hits
+    response = await client.get('/users/me', headers=authorization_header)
+    assert response.status_code == 200  # noqa
+    assert response.json()['name'] == user.name
+    assert USER_CACHE.hits == hits + 1
+
+    # Record writes do not change the cached columns, so they keep it
+    await client.post(
+        '/records',
+        json={
+            'amount': 10,
+            'description': 'Test',
+            'category_id': category.id,
+            'date': '2022-01-01T00:00:00Z',
+        },
+        headers=authorization_header,
+    )
+    hits = USER_CACHE.hits
+    await client.get('/users/me', headers=authorization_header)
+    assert USER_CACHE.hits == hits + 1
+
+    # Updates drop the snapshot
+    await client.patch(
+        f'/users/{user.id}',
+        json={'name': 'New Name'},
+        headers=authorization_header,
+    )
+    response = await client.get('/users/me', headers=authorization_header)
+    assert response.json()['name'] == 'New Name'
+
+
+@pytest.mark.asyncio()
+async def test_update_user_route_changes_updated_at(
+    client, user, authorization_header
+):
+    response = await client.get('/users/me', headers=authorization_header)
+    updated_at = response.json()['updated_at']
+
+    response = await client.patch(
+        f'/users/{user.id}',
+        json={'name': 'New Name'},
+        headers=authorization_header,
+    )
+    assert response.json()['updated_at'] != updated_at
+
+    # And it is stored
+    response = await client.get('/users/me', headers=authorization_header)
+    assert response.json()['updated_at'] != updated_at
@@ -1,9 +1,27 @@
+from typing import Annotated
+
 import pytest
-from httpx import AsyncClient
+from fastapi import APIRouter, Depends, FastAPI
+from httpx import ASGITransport, AsyncClient
+from pydantic import BaseModel, field_serializer
+from sqlalchemy import event, select, text
+from sqlalchemy.ext.asyncio import create_async_engine
+from sqlalchemy.pool import NullPool
 
 from app.core import exc
-from app.core.db.postgres import AsyncSession, get_db
+from app.core.db import postgres
+from app.core.db.postgres import (
+    AsyncSession,
+    async_session,
+    get_db,
+    on_commit,
+    replica_reads,
+)
+from app.core.responses import SchemaJSONResponse
+from app.core.routing import SessionReleasingRoute
 from app.core.sec import get_current_user, get_db_user
+from app.models.user import User
+from app.repositories.user_repository import UserRepository
 
 
 @pytest.mark.asyncio()
@@ -21,10 +39,246 @@ async def test_get_db_dependency():
 
 @pytest.mark.asyncio()
 async def test_get_db_user_dependency():
-    with pytest.raises(exc.UnauthorizedException):
-        await get_db_user({'sub': 123})
+    async with async_session() as session:
+        with pytest.raises(exc.UnauthorizedException):
+            await get_db_user({'sub': 123}, session)
 
 
-def test_get_current_user_dependency_invalid_token_type():
+@pytest.mark.asyncio()
+async def test_get_db_user_dependency_uses_request_session(user):
+    # Loaded from the database and then from the cached snapshot
+    for _ in range(2):
+        async with async_session() as session:
+            db_user = await get_db_user({'sub': user.id}, session)
+            assert db_user in session
+            assert db_user.email == user.email
+
+
+@pytest.mark.asyncio()
+async def test_get_current_user_dependency_invalid_token_type():
     with pytest.raises(exc.UnauthorizedException):
-        get_current_user('Invalid token')
+        await get_current_user('Invalid token')
+
+
+@pytest.mark.asyncio()
+async def test_get_db_session_is_released_before_serialization():
+    sessions, in_transaction = [], []
+
+    class Out(BaseModel):
+        value: int
+
+        @field_serializer('value')
+        def serialize_value(self, value):  # noqa
+            in_transaction.append(sessions[0].in_transaction())
+            return value
+
+    router = APIRouter(route_class=SessionReleasingRoute)
+
+    @router.get('/value', response_model=Out)
+    async def get_value(session: Annotated[AsyncSession, Depends(get_db)]):
+        sessions.append(session)
+        value = await session.scalar(text('SELECT 1'))
+        assert session.in_transaction()
+        return {'value': value}
+
+    app = FastAPI()
+    app.include_router(router)
+    async with AsyncClient(
+        transport=ASGITransport(app), base_url='http://test'
+    ) as client:
+        response = await client.get('/value')
+
+    assert response.json() == {'value': 1}
+    # The connection was back to the pool while serializing
+    assert in_transaction == [False]
+
+
+@pytest.mark.asyncio()
+async def test_replica_reads_until_the_user_writes(monkeypatch, user):
+    replica = create_async_engine(postgres.DATABASE_URI, poolclass=NullPool)
+    monkeypatch.setattr(postgres, 'replica_engine', replica)
+    stmt = select(User)
+
+    try:
+        async with async_session() as session:
+            session.info['user_id'] = user.id
+            with replica_reads(session):
+                bind = session.sync_session.get_bind(clause=stmt)
+                assert bind is replica.sync_engine
+            bind = session.sync_session.get_bind(clause=stmt)
+            assert bind is postgres.engine.sync_engine
+
+            await UserRepository(session).bump_data_version(user.id)
+            await session.commit()
+
+            # Pinned to the primary to read its own write
+            with replica_reads(session):
+                bind = session.sync_session.get_bind(clause=stmt)
+                assert bind is postgres.engine.sync_engine
+    finally:
+        await replica.dispose()
+
+
+@pytest.mark.asyncio()
+async def test_get_db_session_commits_once_per_request(user):
+    commits = []
+    router = APIRouter(route_class=SessionReleasingRoute)
+
+    @router.post('/bump')
+    async def bump(
+        session: Annotated[AsyncSession, Depends(get_db)], fail: bool = False
+    ):
+        user_repository = UserRepository(session)
+        await user_repository.bump_data_version(user.id)
+        await user_repository.bump_data_version(user.id)
+        on_commit(session, commits.append, user.id)
+        if fail:
+            raise exc.BadRequestException('Failed')
+        return {}
+
+    app = FastAPI()
+    app.include_router(router)
+    async with AsyncClient(
+        transport=ASGITransport(app), base_url='http://test'
+    ) as client:
+        failed = await client.post('/bump', params={'fail': True})
+        response = await client.post('/bump')
+
+    assert failed.status_code == 400  # noqa
+    assert response.status_code == 200  # noqa
+    # Only the writes of the successful request were committed
+    async with async_session() as session:
+        data_version = await session.scalar(
+            select(User.data_version).where(User.id == user.id)
+        )
+    assert data_version == 2  # noqa
+    assert commits == [user.id]
+
+
+@pytest.mark.asyncio()
+async def test_replica_reads_data_version_with_the_rows(monkeypatch, user):
+    replica = create_async_engine(postgres.DATABASE_URI, poolclass=NullPool)
+    monkeypatch.setattr(postgres, 'replica_engine', replica)
+    connections = []
+
+    def record_connection(conn, *args):
+        connections.append(conn.connection.dbapi_connection)
+
+    event.listen(
+        replica.sync_engine, 'before_cursor_execute', record_connection
+    )
+    try:
+        async with async_session() as session:
+            session.info['user_id'] = user.id
+            user_repository = UserRepository(session)
+            assert await user_repository.get_data_version(user.id) == 0
+            assert await user_repository.get_all()
+    finally:
+        await replica.dispose()
+
+    # The version and then the rows are read through the same connection
+    assert len(connections) == 2  # noqa
+    assert connections[0] is connections[1]
+
+
+@pytest.mark.asyncio()
+async def test_replica_reads_pinned_by_the_last_write_cookie(
+    monkeypatch, user
+):
+    replica = create_async_engine(postgres.DATABASE_URI, poolclass=NullPool)
+    monkeypatch.setattr(postgres, 'replica_engine', replica)
+    router = APIRouter(route_class=SessionReleasingRoute)
+
+    @router.post('/write')
+    async def write(session: Annotated[AsyncSession, Depends(get_db)]):
+        session.info['user_id'] = user.id
+        await UserRepository(session).bump_data_version(user.id)
+        return {}
+
+    @router.get('/read')
+    async def read(session: Annotated[AsyncSession, Depends(get_db)]):
+        session.info['user_id'] = user.id
+        with replica_reads(session):
+            bind = session.sync_session.get_bind(clause=select(User))
+        return {'replica': bind is replica.sync_engine}
+
+    app = FastAPI()
+    app.include_router(router)
+    try:
+        # The write is only known through the cookie sent back
+        async with AsyncClient(
+            transport=ASGITransport(app), base_url='http://test'
+        ) as client:
+            assert (await client.get('/read')).json() == {'replica': True}
+            response = await client.post('/write')
+            assert postgres.LAST_WRITE_COOKIE in response.cookies
+            assert (await client.get('/read')).json() == {'replica': False}
+    finally:
+        await replica.dispose()
+
+
+@pytest.mark.asyncio()
+async def test_replica_reads_pinned_by_user_without_cookies(monkeypatch, user):
+    replica = create_async_engine(postgres.DATABASE_URI, poolclass=NullPool)
+    monkeypatch.setattr(postgres, 'replica_engine', replica)
+    router = APIRouter(route_class=SessionReleasingRoute)
+
+    @router.post('/write')
+    async def write(session: Annotated[AsyncSession, Depends(get_db)]):
+        session.info['user_id'] = user.id
+        await UserRepository(session).bump_data_version(user.id)
+        return {}
+
+    @router.get('/read')
+    async def read(session: Annotated[AsyncSession, Depends(get_db)]):
+        session.info['user_id'] = user.id
+        with replica_reads(session):
+            bind = session.sync_session.get_bind(clause=select(User))
+        return {'replica': bind is replica.sync_engine}
+
+    app = FastAPI()
+    app.include_router(router)
+    try:
+        # A bearer client that never sends the cookie back
+        async with AsyncClient(
+            transport=ASGITransport(app), base_url='http://test'
+        ) as client:
+            await client.post('/write')
+            client.cookies.clear()
+            assert (await client.get('/read')).json() == {'replica': False}
+    finally:
+        await replica.dispose()
+
+
+@pytest.mark.asyncio()
+async def test_schema_json_response_renders_after_the_session_release():
+    sessions, in_transaction = [], []
+
+    class Out(BaseModel):
+        value: int
+
+    class Row:
+        @property
+        def value(self):
+            in_transaction.append(sessions[0].in_transaction())
+            return 1
+
+    router = APIRouter(route_class=SessionReleasingRoute)
+
+    @router.get('/value', response_model=Out)
+    async def get_value(session: Annotated[AsyncSession, Depends(get_db)]):
+        sessions.append(session)
+        await session.scalar(text('SELECT 1'))
+        return SchemaJSONResponse(Row(), Out)
+
+    app = FastAPI()
+    app.include_router(router)
+    async with AsyncClient(
+        transport=ASGITransport(app), base_url='http://test'
+    ) as client:
+        response = await client.get('/value')
+
+    assert response.json() == {'value': 1}
+    assert response.headers['Content-Length'] == str(len(response.content))
+    # The connection was back to the pool while encoding
+    assert in_transaction == [False]
@@ -1,7 +1,12 @@
+import asyncio
+import threading
+from http import HTTPStatus
+
 import pytest
 from fastapi import HTTPException
 
-from app.core.sec import SecurityService
+from app.core import exc
+from app.core.sec import TOKEN_CACHE, PasswordHashingPool, SecurityService
 
 
 def test_create_jwt_token():
@@ -36,6 +41,19 @@ def test_create_refresh_token_and_decode():
     assert decoded['type'] == 'refresh'
 
 
+def test_verify_token_caches_decoded_token():
+    token = SecurityService.create_access_token({'sub': 1})
+    misses = TOKEN_CACHE.misses
+    decoded = SecurityService.verify_token(token)
+    assert TOKEN_CACHE.misses == misses + 1
+
+    # Served from the cache, as a copy of the claims
+    hits = TOKEN_CACHE.hits
+    decoded['sub'] = 2
+    assert SecurityService.verify_token(token)['sub'] == 1
+    assert TOKEN_CACHE.hits == hits + 1
+
+
 def test_create_token_fail():
     with pytest.raises(HTTPException) as e:
         SecurityService.verify_token('wrong_token')
@@ -57,3 +75,29 @@ def test_password_hashing_fail():
     assert len(hashed) > 0
     assert not SecurityService.verify_password('WrongPassword', hashed)
     assert not SecurityService.verify_password(password, 'WrongHash')
+
+
+@pytest.mark.asyncio()
+async def test_password_hashing_async():
+    password = 'Password123'
+    hashed = await SecurityService.get_password_hash_async(password)
+    assert await SecurityService.verify_password_async(password, hashed)
+    assert not await SecurityService.verify_password_async('Wrong', hashed)
+
+
+@pytest.mark.asyncio()
+async def test_password_hashing_pool_rejects_when_full():
+    pool = PasswordHashingPool(workers=1, queue_size=1)
+    release = threading.Event()
+    # One job running and another one waiting fill the pool
+    jobs = [asyncio.ensure_future(pool.run(release.wait)) for _ in range(2)]
+    await asyncio.sleep(0)
+
+    with pytest.raises(exc.ServiceUnavailableException) as e:
+        await pool.run(release.wait)
+    assert e.value.status_code == HTTPStatus.SERVICE_UNAVAILABLE
+
+    release.set()
+    assert await asyncio.gather(*jobs) == [True, True]
+    # The slots are freed once the jobs end
+    assert await pool.run(release.wait)
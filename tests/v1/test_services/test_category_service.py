@@ -1,8 +1,12 @@
 import pytest
 
 from app.core import exc
+from app.models.category import Category
 from app.schemas.category_schemas import CategoryIn
-from app.services.category_service import CategoryService
+from app.services.category_service import (
+    CategoryService,
+    public_categories_cache,
+)
 
 
 @pytest.mark.asyncio()
@@ -18,6 +22,27 @@ async def test_category_service_get_categories(session, user):
     assert categories == []
 
 
+@pytest.mark.asyncio()
+async def test_category_service_caches_public_categories(session, user):
+    session.add(Category(name='Public'))
+    await session.commit()
+    category_service = CategoryService(session, user)
+    await category_service.create_category(CategoryIn(name='Own'))
+
+    categories = await category_service.get_categories()
+    assert [category.name for category in categories] == ['Public', 'Own']
+    hits = public_categories_cache.hits
+    await category_service.get_categories()
+    assert public_categories_cache.hits == hits + 1
+
+    # Served from the cache until it expires
+    session.add(Category(name='New Public'))
+    await session.commit()
+    assert len(await category_service.get_categories()) == 2  # noqa
+    public_categories_cache.clear()
+    assert len(await category_service.get_categories()) == 3  # noqa
+
+
 @pytest.mark.asyncio()
 async def test_category_service_create_category(session, user):
     category_service = CategoryService(session, user)
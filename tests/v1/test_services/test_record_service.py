@@ -1,9 +1,20 @@
+from datetime import date
+
 import pytest
+from sqlalchemy import event, select
 
+from app.cmd.init_data import add_admin_user_and_records
+from app.cmd.rebuild_rollups import rebuild_users_rollups
 from app.core import exc
-from app.core.db.postgres import async_session
+from app.core.db.postgres import async_session, engine
+from app.models import Record, RecordRollup
+from app.schemas.category_schemas import CategoryIn
 from app.schemas.record_schemas import RecordIn
 from app.schemas.user_schemas import UserIn
+from app.services.category_service import (
+    CategoryService,
+    allowed_categories_cache,
+)
 from app.services.record_service import RecordService
 from app.services.user_service import UserService
 
@@ -31,6 +42,41 @@ async def test_record_service_create_record(user_category_autheaders):
         assert record.amount == new_record.amount
 
 
+@pytest.mark.asyncio()
+async def test_record_service_caches_allowed_categories(
+    session, user_category_autheaders
+):
+    user, category, _ = user_category_autheaders
+    record_service = RecordService(session, user)
+    category_service = CategoryService(session, user)
+    new_record = RecordIn(
+        date='2022-01-01',
+        category_id=category.id,
+        amount=100,
+        description='Test',
+    )
+
+    await record_service.create_record(new_record)
+    hits = allowed_categories_cache.hits
+    record = await record_service.create_record(new_record)
+    assert allowed_categories_cache.hits == hits + 1
+    assert record.category.name == category.name
+
+    # Own categories are allowed as soon as they are created
+    own = await category_service.create_category(CategoryIn(name='Own'))
+    await session.commit()
+    new_record.category_id = own.id
+    record = await record_service.create_record(new_record)
+    assert record.category.name == 'Own'
+
+    # And rejected once their deletion is committed
+    await record_service.delete_record(record.id)
+    await category_service.delete_category(own.id)
+    await session.commit()
+    with pytest.raises(exc.NotFoundException):
+        await record_service.create_record(new_record)
+
+
 @pytest.mark.asyncio()
 async def test_record_service_delete_record(user_category_autheaders):
     user, category, _ = user_category_autheaders
@@ -56,6 +102,50 @@ async def test_record_service_delete_record(user_category_autheaders):
         assert await record_service.get_user_records() == []
 
 
+@pytest.mark.asyncio()
+async def test_record_service_writes_without_selects(
+    user_category_autheaders,
+):
+    user, category, _ = user_category_autheaders
+    statements = []
+
+    def record_statement(conn, cursor, statement, *args):
+        statements.append(statement.split(maxsplit=1)[0])
+
+    async with async_session() as session:
+        record_service = RecordService(session, user)
+        new_record = RecordIn(
+            date='2022-01-01',
+            category_id=category.id,
+            amount=100,
+            description='Test',
+        )
+        # Load the allowed categories into the cache
+        await CategoryService(session, user).get_allowed_categories()
+
+        event.listen(
+            engine.sync_engine, 'before_cursor_execute', record_statement
+        )
+        try:
+            record = await record_service.create_record(new_record)
+            await record_service.delete_record(record.id)
+        finally:
+            event.remove(
+                engine.sync_engine, 'before_cursor_execute', record_statement
+            )
+
+    # The rollups upsert, the data version bump and the record write,
+    # without reading the record back nor checking its owner beforehand
+    assert statements == [
+        'INSERT',
+        'UPDATE',
+        'INSERT',
+        'DELETE',
+        'INSERT',
+        'UPDATE',
+    ]
+
+
 @pytest.mark.asyncio()
 async def test_record_service_delete_record_not_found(
     user_category_autheaders,
@@ -98,3 +188,54 @@ async def test_record_service_delete_record_unauthorized(
 
         with pytest.raises(exc.UnauthorizedException):
             await record_service.delete_record(record.id)
+
+
+@pytest.mark.asyncio()
+async def test_record_service_keeps_rollups_updated(user_category_autheaders):
+    user, category, _ = user_category_autheaders
+    async with async_session() as session:
+        record_service = RecordService(session, user)
+
+        records = [
+            await record_service.create_record(
+                RecordIn(
+                    date=f'2022-01-{day:02}',
+                    category_id=category.id,
+                    amount=amount,
+                    description='Test',
+                )
+            )
+            for day, amount in [(1, 100), (31, 50), (1, 10)]
+        ]
+        await record_service.delete_record(records[-1].id)
+
+        async def get_rollups():
+            result = await session.scalars(
+                select(RecordRollup).where(RecordRollup.user_id == user.id)
+            )
+            return [
+                (rollup.category_id, rollup.month, rollup.total, rollup.count)
+                for rollup in result
+            ]
+
+        expected = [(category.id, date(2022, 1, 1), 150, 2)]
+        assert await get_rollups() == expected
+
+        # Rebuilding from scratch gives the same rollups
+        await rebuild_users_rollups(session, [user.id])
+        await session.commit()
+        session.expire_all()
+        assert await get_rollups() == expected
+
+
+@pytest.mark.asyncio()
+async def test_seeded_records_update_the_rollups(user_category_autheaders):
+    async with async_session() as session:
+        await add_admin_user_and_records(session)
+        records = (await session.scalars(select(Record))).all()
+        rollups = (await session.scalars(select(RecordRollup))).all()
+
+    assert sum(rollup.total for rollup in rollups) == sum(
+        record.amount for record in records
+    )
+    assert sum(rollup.count for rollup in rollups) == len(records)